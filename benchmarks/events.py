@@ -0,0 +1,58 @@
+'''
+Measure how many events per second the event bus gets through: emitting with
+and without a subscriber, publishing a batch, and dispatching through the
+asyncio queue.
+
+Run from the repository root:  python -m benchmarks.events
+'''
+import asyncio
+from time import perf_counter
+from typing import Callable
+
+from src.civ_api import events
+
+
+COUNT = 200_000
+
+
+def rate(run: Callable[[], None]) -> float:
+    start = perf_counter()
+    run()
+    return COUNT / (perf_counter() - start)
+
+
+def emit_each() -> None:
+    for i in range(COUNT):
+        events.emit(None, 'unit_moved', {'step': i})
+
+
+def emit_batch() -> None:
+    events.emit_many(None, 'unit_moved', ({'step': i} for i in range(COUNT)))
+
+
+def publish_batch() -> None:
+    events.publish_events(events.event(None, 'unit_moved', {'step': i}) for i in range(COUNT))
+
+
+async def dispatch_async() -> None:
+    bus = events.AsyncEventBus(maxsize=1024)
+    bus.start()
+    for i in range(COUNT):
+        await bus.emit(None, 'unit_moved', {'step': i})
+    await bus.stop()
+
+
+def main() -> None:
+    print(f'emit, no subscribers      {rate(emit_each):12,.0f} events/s')
+
+    received: list[events.Event] = []
+    events.bind('unit_moved', received.append)
+    print(f'emit, one subscriber      {rate(emit_each):12,.0f} events/s')
+    print(f'emit_many, one subscriber {rate(emit_batch):12,.0f} events/s')
+    print(f'publish_events batch      {rate(publish_batch):12,.0f} events/s')
+    print(f'AsyncEventBus (1024)      {rate(lambda: asyncio.run(dispatch_async())):12,.0f} events/s')
+    events.unbind('unit_moved', received.append)
+
+
+if __name__ == '__main__':
+    main()
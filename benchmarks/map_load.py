@@ -0,0 +1,53 @@
+'''
+Compare loading a map by adding its tiles one TileDict at a time with opening
+its memory-mapped snapshot.
+
+Run from the repository root:  python -m benchmarks.map_load
+'''
+import os
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from uuid import uuid4
+
+from loguru import logger
+
+from src.civ_api.cartography import Map, TileDict
+from src.civ_api.functions import test_get_random_resources
+from src.civ_api.snapshot import open_snapshot, write_snapshot
+
+
+def tile_dicts(width: int, height: int) -> dict[str, TileDict]:
+    tiles: dict[str, TileDict] = {}
+    for x in range(width):
+        for y in range(height):
+            uuid = str(uuid4())
+            tiles[uuid] = TileDict(uuid=uuid, x=x, y=y,
+                                   resources=test_get_random_resources(),
+                                   resource_multiplier=2, movement_multiplier=2,
+                                   occupier_uuid=None, is_mountain=False, is_water=False)
+    return tiles
+
+
+def main() -> None:
+    # The map logs every tile it adds; keep that out of the figures.
+    logger.remove()
+    for width, height in ((100, 100), (500, 500)):
+        tiles = tile_dicts(width, height)
+
+        start = perf_counter()
+        map_ = Map(width, height, tiles)
+        rebuilt = perf_counter() - start
+
+        with TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'map.snapshot')
+            write_snapshot(map_, path)
+            start = perf_counter()
+            open_snapshot(path)
+            opened = perf_counter() - start
+
+        print(f'{width}x{height}: from TileDicts {rebuilt * 1000:9.1f} ms   '
+              f'from snapshot {opened * 1000:7.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+'''
+Report the bytes held per Tile, Entity, Unit and City object.
+
+"Before" figures come from plain __dict__-backed objects holding the same
+fields, which is how these classes stored their attributes before they were
+given __slots__. Run from the repository root:  python -m benchmarks.memory
+'''
+import tracemalloc
+from typing import Any, Callable
+
+from loguru import logger
+
+from src.civ_api.cartography import Map, Tile
+from src.civ_api.entities import City, Entity, Unit
+
+
+class Loose:
+    '''Stand-in for an unslotted object: every field lives in __dict__.'''
+
+    def __init__(self, **fields: Any) -> None:
+        self.__dict__.update(fields)
+
+
+def bytes_per_object(make: Callable[[int], Any], count: int = 20_000) -> float:
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    objects = [make(i) for i in range(count)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    size = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    del objects
+    return size / count
+
+
+def tile_fields(i: int) -> dict[str, Any]:
+    return {'uuid': f'tile-{i}', 'x': i % 200, 'y': i // 200, 
+            'resources': {'iron': 1, 'wheat': 2}, 'resource_multiplier': 2,
+            'movement_multiplier': 2, 'occupier_uuid': None, 
+            'is_mountain': False, 'is_water': False}
+
+
+def entity_fields(i: int) -> dict[str, Any]:
+    return {'abstract_uuid': 'spearman', 'instance_uuid': f'unit-{i}', 
+            'x': i % 200, 'y': i // 200}
+
+
+def city(i: int) -> City:
+    c = City('empire', **entity_fields(i))
+    c.name, c.population, c.level, c.defense, c.attack = 'city', 1, 1, 1, 1
+    return c
+
+
+def main() -> None:
+    # The map logs every tile it adds; keep that out of the figures.
+    logger.remove()
+    side = 200
+    world = Map(side, side)
+    for i in range(side * side):
+        world.add_tile(tile_fields(i))
+
+    rows: list[tuple[str, Callable[[int], Any], Callable[[int], Any]]] = [
+        ('Tile', lambda i: Loose(**tile_fields(i)), lambda i: Tile(**tile_fields(i))),
+        ('Entity', lambda i: Loose(**entity_fields(i)), lambda i: Entity(**entity_fields(i))),
+        ('Unit', lambda i: Loose(empire_uuid='empire', move=None, unit_upgrades=None, 
+                                 **entity_fields(i)),
+                 lambda i: Unit('empire', **entity_fields(i))),
+        ('City', lambda i: Loose(empire_uuid='empire', units=[], tiles=[], upgrades=[],
+                                 name='city', population=1, level=1, defense=1, attack=1,
+                                 **entity_fields(i)),
+                 city),
+    ]
+
+    print(f'{"object":<10}{"before":>12}{"after":>12}')
+    for name, loose, compact in rows:
+        print(f'{name:<10}{bytes_per_object(loose):>12.0f}{bytes_per_object(compact):>12.0f}')
+
+    stored = world.store.nbytes / len(world.store)
+    print(f'{"Map row":<10}{"":>12}{stored:>12.0f}  (numeric columns of the tile store)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,30 @@
+'''
+Measure how many users (each with a fresh map) Alchemist.new_user creates per
+second at several map sizes, against an in-memory SQLite database.
+
+Run from the repository root:  python -m benchmarks.new_user
+'''
+from time import perf_counter
+
+from databases.alchemy_controller import Alchemist
+from databases.sqlalchemy_models import Base
+
+
+def users_per_second(width: int, height: int, users: int) -> float:
+    db = Alchemist('sqlite://')
+    Base.metadata.create_all(db.engine)
+    start = perf_counter()
+    for i in range(users):
+        db.new_user(f'BENCH_USER_{i:04}', (width, height))
+    return users / (perf_counter() - start)
+
+
+def main() -> None:
+    for (width, height), users in (((25, 25), 50), ((100, 100), 5), ((500, 500), 1)):
+        rate = users_per_second(width, height, users)
+        tiles = width * height * rate
+        print(f'{width}x{height}: {rate:8.2f} users/s  ({tiles:,.0f} tiles/s)')
+
+
+if __name__ == '__main__':
+    main()
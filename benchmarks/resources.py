@@ -0,0 +1,63 @@
+'''
+Compare city resource totals computed from TileDicts one key at a time with
+the batched TileStore pass.
+
+Run from the repository root:  python -m benchmarks.resources
+'''
+from random import randint
+from timeit import timeit
+
+import numpy as np
+
+from src.civ_api.functions import test_get_random_resources, total_resources
+from src.civ_api.tile_store import TileStore
+
+
+def build(width: int, height: int) -> tuple[TileStore, list[dict]]:
+    store = TileStore(width * height)
+    tiles: list[dict] = []
+    for x in range(width):
+        for y in range(height):
+            tile = {'uuid': f'{x}-{y}', 'x': x, 'y': y,
+                    'resources': test_get_random_resources(),
+                    'resource_multiplier': randint(1, 3)}
+            store.append(**tile)
+            tiles.append(tile)
+    return store, tiles
+
+
+def city_rows(width: int, height: int, cities: int, radius: int) -> list[list[int]]:
+    groups: list[list[int]] = []
+    for _ in range(cities):
+        cx, cy = randint(radius, width - radius - 1), randint(radius, height - radius - 1)
+        groups.append([x * height + y 
+                       for x in range(cx - radius, cx + radius + 1)
+                       for y in range(cy - radius, cy + radius + 1)])
+    return groups
+
+
+def dict_loop(tiles: list[dict], groups: list[list[int]]) -> list[dict[str, int]]:
+    results: list[dict[str, int]] = []
+    for group in groups:
+        scaled = [{k: v * tiles[row]['resource_multiplier'] 
+                   for k, v in tiles[row]['resources'].items()} for row in group]
+        results.append(total_resources(scaled))
+    return results
+
+
+def main(width: int = 200, height: int = 200, cities: int = 200, radius: int = 2) -> None:
+    store, tiles = build(width, height)
+    groups = city_rows(width, height, cities, radius)
+    arrays = [np.array(g, dtype=np.int32) for g in groups]
+
+    runs = 20
+    loop = timeit(lambda: dict_loop(tiles, groups), number=runs) / runs
+    batched = timeit(lambda: store.total_resources(arrays), number=runs) / runs
+
+    print(f'{width}x{height} map, {cities} cities of {len(groups[0])} tiles')
+    print(f'  dict loop : {loop * 1000:8.3f} ms / turn')
+    print(f'  batched   : {batched * 1000:8.3f} ms / turn  ({loop / batched:.1f}x)')
+
+
+if __name__ == '__main__':
+    main()
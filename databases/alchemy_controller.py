@@ -1,78 +1,397 @@
+from contextlib import contextmanager
 from datetime import datetime
-from typing import Optional
+from typing import Any, Iterable, Iterator, Optional
 from uuid import uuid4
 
-from sqlalchemy import Engine, select, create_engine
-from sqlalchemy.orm import Session
+import numpy as np
+from numpy.typing import NDArray
+from sqlalchemy import (Engine, 
+                        Select, 
+                        Table, 
+                        create_engine, 
+                        event, 
+                        func, 
+                        insert, 
+                        make_url, 
+                        select)
+from sqlalchemy.exc import NoResultFound
+from sqlalchemy.orm import (Session, 
+                            contains_eager, 
+                            noload, 
+                            selectinload, 
+                            sessionmaker)
 
+from src.civ_api.constants.enums import ResourceStorage
+from src.civ_api.constants.resources import resource_ids
 from src.civ_api.type_aliasing import IntPair
-from src.civ_api.functions import test_get_random_resources
-from databases.sqlalchemy_models import User, Tile, Resource
+from src.civ_api.functions import (test_get_random_resources,
+                                   test_get_random_resource_table)
+from src.civ_api.tile_store import RESOURCE_COLUMNS, RESOURCE_INDEX
+from databases.sqlalchemy_models import User, Tile, Resource, TileResource
 
 
 resource_generator = test_get_random_resources
+resource_table_generator = test_get_random_resource_table
+
+# Sparse rows name resources by their stable id, not their column position.
+RESOURCE_NAMES: dict[int, str] = {i: name for name, i in resource_ids.items()}
+ID_COLUMNS: dict[int, int] = {resource_ids[name]: RESOURCE_INDEX[name] for name in RESOURCE_COLUMNS}
+
+# Largest number of uuids bound into one IN (...) clause; older SQLite builds
+# cap a statement at 999 parameters.
+IN_CLAUSE_CHUNK = 900
+
+# Applied to every new SQLite connection. WAL lets many readers run alongside
+# one writer, and the busy timeout makes a second writer wait for the lock 
+# instead of failing straight away.
+SQLITE_PRAGMAS: dict[str, str | int] = {'journal_mode': 'WAL',
+                                        'synchronous': 'NORMAL',
+                                        'busy_timeout': 5000}
+
+
+def is_sqlite_memory(db_address: str) -> bool:
+    url = make_url(db_address)
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+
+def pool_options(db_address: str, pool_size: int, max_overflow: int) -> dict[str, Any]:
+    '''Engine keyword arguments for a connection pool suited to the database.'''
+    if is_sqlite_memory(db_address):
+        # An in-memory database only lives as long as its single connection.
+        return {}
+    options: dict[str, Any] = {'pool_size': pool_size, 
+                               'max_overflow': max_overflow,
+                               'pool_pre_ping': True}
+    if make_url(db_address).get_backend_name() == 'sqlite':
+        # Pooled connections are handed between request threads.
+        options['connect_args'] = {'check_same_thread': False}
+    return options
+
+
+def apply_sqlite_pragmas(engine: Engine) -> None:
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection: Any, _: Any) -> None:
+        cursor = dbapi_connection.cursor()
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {name} = {value};')
+        cursor.close()
+
+
+def distinct_chunks(uuids: list[str]) -> Iterator[list[str]]:
+    '''Split the distinct uuids into groups small enough for one IN (...) clause.'''
+    wanted = list(dict.fromkeys(uuids))
+    for start in range(0, len(wanted), IN_CLAUSE_CHUNK):
+        yield wanted[start:start + IN_CLAUSE_CHUNK]
+
+
+def resource_table(storage: ResourceStorage) -> Table:
+    return TileResource.__table__ if storage == ResourceStorage.SPARSE else Resource.__table__
+
+
+def resource_rows(tile_uuids: list[str],
+                  names: list[str],
+                  amounts: NDArray[np.int64],
+                  storage: ResourceStorage = ResourceStorage.WIDE
+                  ) -> list[dict[str, Any]]:
+    '''Lay out a (tiles x names) table of amounts as rows for the chosen storage.'''
+    if storage == ResourceStorage.SPARSE:
+        ids = np.array([resource_ids[name] for name in names], dtype=np.int64)
+        tiles, columns = np.nonzero(amounts)
+        return [{'tile_uuid': tile_uuids[t], 'resource_id': r, 'amount': a}
+                for t, r, a in zip(tiles.tolist(), 
+                                   ids[columns].tolist(), 
+                                   amounts[tiles, columns].tolist())]
+
+    values = amounts.astype(object)
+    values[amounts == 0] = None
+    return [dict(zip(names, row), tile_uuid=t)
+            for t, row in zip(tile_uuids, values.tolist())]
+
+
+def new_user_rows(user_uuid: str,
+                  dimensions: Optional[IntPair] = None,
+                  storage: ResourceStorage = ResourceStorage.WIDE
+                  ) -> tuple[User, list[dict[str, Any]], list[dict[str, Any]]]:
+    '''
+    Build a new user with a fresh map. The tile and resource rows are 
+    generated as whole columns, ready for one executemany INSERT each rather
+    than one ORM object per row.
+    '''
+    width, height = dimensions or (25, 25)
+    user = User(user_uuid=user_uuid, 
+                last_updated=datetime.now(),
+                created=datetime.now(),
+                width=width,
+                height=height)
+
+    count = width * height
+    xs, ys = np.indices((width, height)).reshape(2, count).tolist()
+    tile_uuids = [str(uuid4()) for _ in range(count)]
+    tiles = [{'user_uuid': user_uuid, 'tile_uuid': t, 'x': x, 'y': y}
+             for t, x, y in zip(tile_uuids, xs, ys)]
+
+    names, amounts = resource_table_generator(count)
+    return user, tiles, resource_rows(tile_uuids, names, amounts, storage)
+
+
+def user_statement(user_uuid: str, 
+                   load_tiles: bool = False,
+                   storage: ResourceStorage = ResourceStorage.WIDE
+                   ) -> Select[tuple[User]]:
+    sql = select(User).where(User.user_uuid == user_uuid)
+    if load_tiles:
+        tiles = selectinload(User.tiles)
+        # Sparse resources are not in the wide table; skip its selectin query.
+        if storage == ResourceStorage.SPARSE:
+            tiles = tiles.noload(Tile.resource)
+        sql = sql.options(tiles)
+    return sql
+
+
+def tile_statements(user_uuid: str, 
+                    tile_uuids: list[str],
+                    storage: ResourceStorage = ResourceStorage.WIDE
+                    ) -> Iterator[Select[Any]]:
+    '''One joined tile/resource query per IN_CLAUSE_CHUNK distinct uuids.'''
+    for chunk in distinct_chunks(tile_uuids):
+        wanted = (Tile.user_uuid == user_uuid) & (Tile.tile_uuid.in_(chunk))
+        if storage == ResourceStorage.SPARSE:
+            yield (select(Tile, TileResource.resource_id, TileResource.amount)
+                   .outerjoin(TileResource, TileResource.tile_uuid == Tile.tile_uuid)
+                   .options(noload(Tile.resource))
+                   .where(wanted))
+        else:
+            yield (select(Tile, Resource)
+                   .join(Tile.resource)
+                   .options(contains_eager(Tile.resource))
+                   .where(wanted))
+
+
+def collect_tiles(rows: Iterable[Any],
+                  found: dict[str, tuple[Tile, Resource]],
+                  storage: ResourceStorage = ResourceStorage.WIDE
+                  ) -> None:
+    '''
+    Gather the rows of a tile_statements query by tile uuid. Sparse rows are
+    folded into a detached Resource, so callers see the same objects either
+    way.
+    '''
+    if storage == ResourceStorage.SPARSE:
+        for t, resource_id, amount in rows:
+            _, r = found.setdefault(t.tile_uuid, (t, Resource(tile_uuid=t.tile_uuid)))
+            if resource_id is not None:
+                setattr(r, RESOURCE_NAMES[resource_id], amount)
+    else:
+        for t, r in rows:
+            found[t.tile_uuid] = (t, r)
+
+
+def in_requested_order(user_uuid: str,
+                       tile_uuids: list[str],
+                       found: dict[str, tuple[Tile, Resource]]
+                       ) -> list[tuple[Tile, Resource]]:
+    missing = [tile_uuid for tile_uuid in dict.fromkeys(tile_uuids) if tile_uuid not in found]
+    if missing:
+        raise NoResultFound(f'No tiles found for user {user_uuid} with IDs: {missing}')
+    return [found[tile_uuid] for tile_uuid in tile_uuids]
+
+
+def resource_array_statements(user_uuid: str,
+                              tile_uuids: list[str],
+                              storage: ResourceStorage = ResourceStorage.WIDE
+                              ) -> Iterator[Select[Any]]:
+    for chunk in distinct_chunks(tile_uuids):
+        wanted = (Tile.user_uuid == user_uuid) & (Tile.tile_uuid.in_(chunk))
+        if storage == ResourceStorage.SPARSE:
+            yield (select(TileResource.tile_uuid, TileResource.resource_id, TileResource.amount)
+                   .join(Tile, Tile.tile_uuid == TileResource.tile_uuid)
+                   .where(wanted))
+        else:
+            yield (select(Resource.tile_uuid, 
+                          *[getattr(Resource, column) for column in RESOURCE_COLUMNS])
+                   .join(Tile, Tile.tile_uuid == Resource.tile_uuid)
+                   .where(wanted))
+
+
+def decode_resource_rows(rows: list[Any],
+                         tile_uuids: list[str],
+                         storage: ResourceStorage = ResourceStorage.WIDE
+                         ) -> NDArray[np.int64]:
+    '''
+    Turn the rows of resource_array_statements into a (tiles x resources) 
+    table lined up with tile_uuids, columns following RESOURCE_COLUMNS.
+    '''
+    wanted = list(dict.fromkeys(tile_uuids))
+    position = {tile_uuid: i for i, tile_uuid in enumerate(wanted)}
+    table = np.zeros((len(wanted), len(RESOURCE_COLUMNS)), dtype=np.int64)
+    if rows:
+        uuids, *columns = zip(*rows)
+        at = np.fromiter((position[tile_uuid] for tile_uuid in uuids), 
+                         dtype=np.intp, count=len(uuids))
+        if storage == ResourceStorage.SPARSE:
+            table[at, [ID_COLUMNS[resource_id] for resource_id in columns[0]]] = columns[1]
+        else:
+            values = np.array(columns, dtype=object).T
+            table[at] = np.where(np.equal(values, None), 0, values).astype(np.int64)
+    return table[[position[tile_uuid] for tile_uuid in tile_uuids]]
+
+
+def region_totals_statement(user_uuid: str,
+                            x0: int, y0: int, x1: int, y1: int,
+                            storage: ResourceStorage = ResourceStorage.WIDE
+                            ) -> Select[Any]:
+    '''A single query summing the resources of the user's tiles in a rectangle.'''
+    in_region = ((Tile.user_uuid == user_uuid) &
+                 Tile.x.between(x0, x1) & 
+                 Tile.y.between(y0, y1))
+    if storage == ResourceStorage.SPARSE:
+        return (select(TileResource.resource_id, func.sum(TileResource.amount))
+                .join(Tile, Tile.tile_uuid == TileResource.tile_uuid)
+                .where(in_region)
+                .group_by(TileResource.resource_id))
+    return (select(*[func.sum(getattr(Resource, column)) for column in RESOURCE_COLUMNS])
+            .join(Tile, Tile.tile_uuid == Resource.tile_uuid)
+            .where(in_region))
+
+
+def decode_region_totals(rows: list[Any],
+                         storage: ResourceStorage = ResourceStorage.WIDE
+                         ) -> dict[str, int]:
+    if storage == ResourceStorage.SPARSE:
+        return {RESOURCE_NAMES[resource_id]: int(total) 
+                for resource_id, total in rows if total}
+    return {column: int(total) 
+            for column, total in zip(RESOURCE_COLUMNS, rows[0]) if total}
 
 
 class Alchemist:
+    '''
+    ORM access to the game database.
+
+    By default one Session lives as long as the Alchemist and is shared by
+    every call, so objects it returns can keep lazy-loading. With per_request,
+    each call instead runs in its own short-lived session checked out of a 
+    connection pool, so one process can serve requests for different users 
+    in parallel; objects returned then stay usable but detached, so load what
+    you need up front (e.g. get_user(..., load_tiles=True)). Several calls can
+    share one transaction by passing the session from unit_of_work().
+
+    resource_storage picks the layout of tile resources (see ResourceStorage).
+    get_tiles returns Resource objects either way, but with SPARSE storage
+    Tile.resource is not filled in; use get_tiles or get_resource_array.
+    '''
 
-    def __init__(self, db_address: str) -> None:
+    def __init__(self, 
+                 db_address: str, 
+                 per_request: bool = False,
+                 pool_size: int = 5,
+                 max_overflow: int = 10,
+                 resource_storage: ResourceStorage = ResourceStorage.WIDE
+                 ) -> None:
 
-        self.engine = create_engine(db_address)
-        self.session = Session(self.engine)
+        self.resource_storage: ResourceStorage = resource_storage
+        self.engine = create_engine(db_address, 
+                                    **pool_options(db_address, pool_size, max_overflow))
+        apply_sqlite_pragmas(self.engine)
+        self.sessions: sessionmaker[Session] = sessionmaker(self.engine, expire_on_commit=False)
+        self.session: Optional[Session] = None if per_request else self.sessions()
+
+
+    @contextmanager
+    def unit_of_work(self, session: Optional[Session] = None) -> Iterator[Session]:
+        '''
+        Provide a session for one unit of work, committing when it finishes 
+        and rolling back if it raises. A session passed in belongs to the 
+        caller and is handed back untouched.
+        '''
+        if session is not None:
+            yield session
+        elif self.session is not None:
+            try:
+                yield self.session
+                self.session.commit()
+            except Exception:
+                self.session.rollback()
+                raise
+        else:
+            with self.sessions.begin() as session:
+                yield session
 
 
     def new_user(self, 
                  user_uuid: str, 
-                 dimensions: Optional[IntPair] = None
+                 dimensions: Optional[IntPair] = None,
+                 session: Optional[Session] = None
                 ) -> None:
         
-        width, height = dimensions or (25, 25)
-        self.session.add(User(user_uuid=user_uuid, 
-                              last_updated=datetime.now(),
-                              created=datetime.now(),
-                              width=width,
-                              height=height))
-        
-        # Create tile map
-        for x in range(width):
-            for y in range(height):
-                tile_uuid = str(uuid4())
-                self.session.add(Tile(user_uuid=user_uuid,
-                                      tile_uuid=tile_uuid,
-                                      x=x,
-                                      y=y))
+        user, tiles, resources = new_user_rows(user_uuid, dimensions, self.resource_storage)
+        with self.unit_of_work(session) as session:
+            session.add(user)
+            session.flush()
+            session.execute(insert(Tile.__table__), tiles)
+            if resources:
+                session.execute(insert(resource_table(self.resource_storage)), resources)
 
-                self.session.add(Resource(**resource_generator(),
-                                          tile_uuid=tile_uuid))
 
-
-    def get_user(self, user_uuid: str) -> User:
-        sql = select(User).where(User.user_uuid == user_uuid)
-        result = self.session.execute(sql).scalars()
-        return result.one()
+    def get_user(self, 
+                 user_uuid: str, 
+                 load_tiles: bool = False,
+                 session: Optional[Session] = None
+                 ) -> User:
+        '''
+        Get a user. With load_tiles, the user's tiles (and through them, their
+        resources) are fetched up front in batched IN queries rather than 
+        lazily.
+        '''
+        with self.unit_of_work(session) as session:
+            sql = user_statement(user_uuid, load_tiles, self.resource_storage)
+            return session.execute(sql).scalars().one()
 
 
     def get_tiles(self,
                 user_uuid: str, 
-                tile_uuids: list[str]
+                tile_uuids: list[str],
+                session: Optional[Session] = None
                 ) -> list[tuple[Tile, Resource]]:
         '''
         Get a list of tiles from a list of tile uuid addresses.
+
+        Tiles and their resources are loaded together with one joined query 
+        per IN_CLAUSE_CHUNK uuids, and returned in the order requested.
         '''
-        tile_resources: list[tuple[Tile, Resource]] = []
-        for tile_uuid in tile_uuids:
-            sql = select(Tile).where((Tile.tile_uuid==tile_uuid) &
-                                     (Tile.user_uuid == user_uuid))
-            result = self.session.execute(sql).scalars()
-            t = result.one()
-
-            sql = select(Resource).where(Resource.tile_uuid == tile_uuid)
-            result = self.session.execute(sql).scalars()
-            r = result.one()
-
-            tile_resources.append((t, r))
-        return tile_resources
-    
-
-    
-        
+        found: dict[str, tuple[Tile, Resource]] = {}
+        with self.unit_of_work(session) as session:
+            for sql in tile_statements(user_uuid, tile_uuids, self.resource_storage):
+                collect_tiles(session.execute(sql).tuples(), found, self.resource_storage)
+        return in_requested_order(user_uuid, tile_uuids, found)
+
+
+    def get_resource_array(self,
+                           user_uuid: str,
+                           tile_uuids: list[str],
+                           session: Optional[Session] = None
+                           ) -> NDArray[np.int64]:
+        '''
+        Get the resources of many tiles as a (tiles x resources) table lined 
+        up with tile_uuids, columns following RESOURCE_COLUMNS.
+        '''
+        rows: list[Any] = []
+        with self.unit_of_work(session) as session:
+            for sql in resource_array_statements(user_uuid, tile_uuids, self.resource_storage):
+                rows.extend(session.execute(sql).tuples())
+        return decode_resource_rows(rows, tile_uuids, self.resource_storage)
+
+
+    def get_region_totals(self,
+                          user_uuid: str,
+                          x0: int, y0: int, x1: int, y1: int,
+                          session: Optional[Session] = None
+                          ) -> dict[str, int]:
+        '''Sum the resources of the user's tiles in a rectangle (corners included).'''
+        sql = region_totals_statement(user_uuid, x0, y0, x1, y1, self.resource_storage)
+        with self.unit_of_work(session) as session:
+            rows = list(session.execute(sql).tuples())
+        return decode_region_totals(rows, self.resource_storage)
@@ -12,4 +12,16 @@ engine = create_engine(use_db, echo=False)
 
 def init() -> None:
     Base.metadata.create_all(engine)
+    create_indexes()
+
+
+def create_indexes() -> None:
+    '''
+    Add any declared index that is missing. create_all only builds indexes
+    along with new tables, so databases made before an index was declared
+    need this to pick it up.
+    '''
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
 
@@ -0,0 +1,146 @@
+'''
+Asyncio version of the Alchemist API, for use from the FastAPI service.
+
+Uses SQLAlchemy's async engine, so the database address needs an async driver,
+e.g. "sqlite+aiosqlite:///databases/learn_sqlalchemy.db".
+'''
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Optional
+
+import numpy as np
+from numpy.typing import NDArray
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import (AsyncSession,
+                                    async_sessionmaker,
+                                    create_async_engine)
+
+from src.civ_api.type_aliasing import IntPair
+from src.civ_api.constants.enums import ResourceStorage
+from databases.alchemy_controller import (apply_sqlite_pragmas,
+                                          collect_tiles,
+                                          decode_region_totals,
+                                          decode_resource_rows,
+                                          in_requested_order,
+                                          new_user_rows,
+                                          pool_options,
+                                          region_totals_statement,
+                                          resource_array_statements,
+                                          resource_table,
+                                          tile_statements,
+                                          user_statement)
+from databases.sqlalchemy_models import Base, User, Tile, Resource
+
+
+class AsyncAlchemist:
+    '''
+    Coroutine counterparts of Alchemist.new_user, get_user and get_tiles.
+
+    Every call runs in its own short-lived AsyncSession from a pooled engine,
+    so one worker can keep many requests in flight without a thread each.
+    Objects come back detached with their loaded attributes intact; nothing
+    can be lazy-loaded afterwards, so ask for tiles with load_tiles=True.
+    '''
+
+    def __init__(self,
+                 db_address: str,
+                 pool_size: int = 5,
+                 max_overflow: int = 10,
+                 resource_storage: ResourceStorage = ResourceStorage.WIDE
+                 ) -> None:
+
+        self.resource_storage: ResourceStorage = resource_storage
+        self.engine = create_async_engine(db_address,
+                                          **pool_options(db_address, pool_size, max_overflow))
+        apply_sqlite_pragmas(self.engine.sync_engine)
+        self.sessions: async_sessionmaker[AsyncSession] = async_sessionmaker(self.engine,
+                                                                             expire_on_commit=False)
+
+
+    async def create_all(self) -> None:
+        async with self.engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+
+
+    async def dispose(self) -> None:
+        await self.engine.dispose()
+
+
+    @asynccontextmanager
+    async def unit_of_work(self,
+                           session: Optional[AsyncSession] = None
+                           ) -> AsyncIterator[AsyncSession]:
+        '''
+        Provide a session for one unit of work, committing when it finishes
+        and rolling back if it raises. A session passed in belongs to the
+        caller and is handed back untouched.
+        '''
+        if session is not None:
+            yield session
+        else:
+            async with self.sessions.begin() as session:
+                yield session
+
+
+    async def new_user(self,
+                       user_uuid: str,
+                       dimensions: Optional[IntPair] = None,
+                       session: Optional[AsyncSession] = None
+                       ) -> None:
+
+        user, tiles, resources = new_user_rows(user_uuid, dimensions, self.resource_storage)
+        async with self.unit_of_work(session) as session:
+            session.add(user)
+            await session.flush()
+            await session.execute(insert(Tile.__table__), tiles)
+            if resources:
+                await session.execute(insert(resource_table(self.resource_storage)), resources)
+
+
+    async def get_user(self,
+                       user_uuid: str,
+                       load_tiles: bool = False,
+                       session: Optional[AsyncSession] = None
+                       ) -> User:
+        async with self.unit_of_work(session) as session:
+            result = await session.execute(user_statement(user_uuid, load_tiles, 
+                                                          self.resource_storage))
+            return result.scalars().one()
+
+
+    async def get_tiles(self,
+                        user_uuid: str,
+                        tile_uuids: list[str],
+                        session: Optional[AsyncSession] = None
+                        ) -> list[tuple[Tile, Resource]]:
+        '''
+        Get a list of tiles from a list of tile uuid addresses, in the order
+        requested.
+        '''
+        found: dict[str, tuple[Tile, Resource]] = {}
+        async with self.unit_of_work(session) as session:
+            for sql in tile_statements(user_uuid, tile_uuids, self.resource_storage):
+                collect_tiles((await session.execute(sql)).tuples(), found, self.resource_storage)
+        return in_requested_order(user_uuid, tile_uuids, found)
+
+
+    async def get_resource_array(self,
+                                 user_uuid: str,
+                                 tile_uuids: list[str],
+                                 session: Optional[AsyncSession] = None
+                                 ) -> NDArray[np.int64]:
+        rows: list[Any] = []
+        async with self.unit_of_work(session) as session:
+            for sql in resource_array_statements(user_uuid, tile_uuids, self.resource_storage):
+                rows.extend((await session.execute(sql)).tuples())
+        return decode_resource_rows(rows, tile_uuids, self.resource_storage)
+
+
+    async def get_region_totals(self,
+                                user_uuid: str,
+                                x0: int, y0: int, x1: int, y1: int,
+                                session: Optional[AsyncSession] = None
+                                ) -> dict[str, int]:
+        sql = region_totals_statement(user_uuid, x0, y0, x1, y1, self.resource_storage)
+        async with self.unit_of_work(session) as session:
+            rows = list((await session.execute(sql)).tuples())
+        return decode_region_totals(rows, self.resource_storage)
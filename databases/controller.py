@@ -1,16 +1,120 @@
 import sqlite3
+from contextlib import contextmanager
+from functools import lru_cache
+from itertools import repeat
 from loguru import logger
-from typing import Any
-from civ_api.functions import SQL_keyrefs_eq, SQL_keyrefs_insert
+from typing import Any, Iterable, Iterator
+from uuid import uuid4
 
+import numpy as np
+
+from databases.setup import TEST_DATABASE, setup_database
+from src.civ_api.functions import (SQL_keyrefs_eq, 
+                                   SQL_keyrefs_insert, 
+                                   test_get_random_resource_table)
+from src.civ_api.constants.enums import ResourceStorage, RowFormat
+from src.civ_api.constants.resources import resource_ids
 from src.civ_api.type_aliasing import BasicDict, ImmutableType
 
 
+# Settings for writing a whole map at once: NORMAL syncs less often than
+# FULL, and a larger page cache (negative = KiB) keeps index pages in memory.
+# All of them only last for the connection, and new_map puts them back once
+# the map is written. (journal_mode is left alone: WAL sticks to the file.)
+BULK_LOAD_PRAGMAS: dict[str, ImmutableType] = {'synchronous': 'NORMAL',
+                                               'cache_size': -64000,
+                                               'temp_store': 'MEMORY'}
+
+# sqlite3 keeps compiled statements keyed by their SQL text; with the text
+# below built once per (table, columns), each shape is compiled only once.
+STATEMENT_CACHE_SIZE = 256
+
+# Record arrays need fixed-width text; uuids take 36 characters.
+RECORD_TEXT_WIDTH = 64
+
+# What a NULL becomes in a record array, by kind of field. (Integer fields
+# cannot hold NaN, so a NULL there reads as 0.)
+RECORD_NULLS: dict[str, Any] = {'i': 0, 'f': np.nan, 'U': '', 'O': None}
+
+# Rows fetched from SQLite per chunk when streaming a table.
+DEFAULT_CHUNK_SIZE = 1000
+
+
+# Table and column names cannot be bound as parameters, so they go into the
+# text; every value is bound. Keyed on column tuples, so callers pass tuple(dict).
+
+@lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+def select_statement(table_name: str, columns: tuple[str, ...]) -> str:
+    conditions = ' AND '.join(SQL_keyrefs_eq(dict.fromkeys(columns)))
+    return f'SELECT * FROM {table_name} WHERE {conditions};'
+
+
+@lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+def insert_statement(table_name: str, columns: tuple[str, ...]) -> str:
+    keys, keyrefs = SQL_keyrefs_insert(dict.fromkeys(columns))
+    return f'INSERT INTO {table_name}({keys}) VALUES ({keyrefs});'
+
+
+@lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+def update_statement(table_name: str, primary_key: str, columns: tuple[str, ...]) -> str:
+    values = ', '.join(SQL_keyrefs_eq(dict.fromkeys(k for k in columns if k != primary_key)))
+    if not values:
+        raise ValueError(f'No columns to update in {table_name} besides {primary_key}.')
+    return f'UPDATE {table_name} SET {values} WHERE {primary_key} = :{primary_key};'
+
+
+def group_by_columns(rows: Iterable[BasicDict]) -> dict[tuple[str, ...], list[BasicDict]]:
+    '''Group rows by their set of keys, so each group fits one statement.'''
+    groups: dict[tuple[str, ...], list[BasicDict]] = {}
+    for row in rows:
+        groups.setdefault(tuple(row), []).append(row)
+    return groups
+
+
+def column_dtype(declared_type: str) -> str:
+    '''
+    The record field type for a declared column type, following SQLite's
+    rules for column affinity: integers, reals, fixed-width text, and
+    Python objects for anything else (e.g. BLOB or no type at all).
+    '''
+    declared_type = declared_type.upper()
+    if 'INT' in declared_type:
+        return '<i8'
+    if any(name in declared_type for name in ('CHAR', 'CLOB', 'TEXT')):
+        return f'<U{RECORD_TEXT_WIDTH}'
+    if not declared_type or 'BLOB' in declared_type:
+        return 'O'
+    return '<f8'
+
+
+def to_records(rows: list[Any], dtype: np.dtype) -> np.recarray:
+    '''Lay rows out as a record array of dtype, filling NULLs from RECORD_NULLS.'''
+    records = np.recarray(len(rows), dtype=dtype)
+    for name, values in zip(dtype.names, zip(*rows)):
+        field = dtype[name]
+        if None in values:
+            fill = RECORD_NULLS[field.kind]
+            values = tuple(fill if value is None else value for value in values)
+        if field.kind == 'U':
+            values = tuple(map(str, values))
+            longest = max(map(len, values), default=0)
+            if longest > RECORD_TEXT_WIDTH:
+                raise ValueError(f'Column {name} holds text of {longest} characters; '
+                                 f'records hold at most {RECORD_TEXT_WIDTH}.')
+        records[name] = values
+    return records
+
+
 class DatabaseManager:
-    def __init__(self, path: str, user_uuid: str) -> None:
+    def __init__(self, 
+                 path: str, 
+                 user_uuid: str,
+                 resource_storage: ResourceStorage = ResourceStorage.WIDE
+                 ) -> None:
         self.__user_uuid: str = user_uuid
+        self.resource_storage: ResourceStorage = resource_storage
         self.__path: str = path
-        self.__con: sqlite3.Connection = sqlite3.connect(path)
+        self.__con: sqlite3.Connection = sqlite3.connect(path, cached_statements=STATEMENT_CACHE_SIZE)
         self.__cur: sqlite3.Cursor = self.__con.cursor()
 
     def commit(self) -> None:
@@ -22,6 +126,66 @@ class DatabaseManager:
     def __del__(self):
         self.__con.close()
 
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        '''
+        Commit everything executed inside the block together, or roll it all
+        back if the block raises.
+        '''
+        try:
+            with self.__con:
+                yield
+        except sqlite3.Error as e:
+            logger.debug(f'Transaction failed and was rolled back: {e}')
+            raise e
+
+
+    def apply_pragmas(self, pragmas: dict[str, ImmutableType]) -> None:
+        for name, value in pragmas.items():
+            self.__cur.execute(f'PRAGMA {name} = {value};')
+
+
+    def read_pragmas(self, names: Iterable[str]) -> dict[str, ImmutableType]:
+        return {name: self.__cur.execute(f'PRAGMA {name};').fetchone()[0] for name in names}
+
+
+    @contextmanager
+    def pragmas(self, pragmas: dict[str, ImmutableType]) -> Iterator[None]:
+        '''
+        Apply pragmas for the length of the block, then restore the old values.
+        Writes still waiting are committed first, since SQLite will not change
+        some settings (e.g. synchronous) inside a transaction.
+        '''
+        if pragmas and self.__con.in_transaction:
+            self.__con.commit()
+        previous = self.read_pragmas(pragmas)
+        self.apply_pragmas(pragmas)
+        try:
+            yield
+        finally:
+            self.apply_pragmas(previous)
+
+
+    def get_resources(self, tile_uuid: str) -> dict[str, int]:
+        '''The non-zero resources of a tile, whichever layout they are stored in.'''
+        if self.resource_storage == ResourceStorage.SPARSE:
+            rows = self.get_filtered_table('tile_resource', {'tile_uuid': tile_uuid})
+            names = {i: name for name, i in resource_ids.items()}
+            return {names[int(row['resource_id'])]: int(row['amount']) 
+                    for row in rows if row['amount']}
+        rows = self.get_filtered_table('resources', {'tile_uuid': tile_uuid})
+        if not rows:
+            raise ValueError(f'No row in resources with ID: {tile_uuid}')
+        return {name: int(amount) for name, amount in rows[0].items() 
+                if name != 'tile_uuid' and amount}
+
+
+    def user_exists(self, user_uuid: str) -> bool:
+        cursor = self.__cur.execute('SELECT 1 FROM users WHERE user_uuid = ? LIMIT 1;',
+                                    (user_uuid,))
+        return cursor.fetchone() is not None
+
     
     def get_full_table(self, table_name: str) -> list[BasicDict]:
         cursor = self.__cur.execute(f'SELECT * FROM {table_name} ;')
@@ -34,14 +198,73 @@ class DatabaseManager:
                            table_name: str, 
                            dictionary: dict[str, ImmutableType]
                            ) -> list[BasicDict]:
-        symbols = SQL_keyrefs_eq(dictionary)
-        conditions = "AND ".join(symbols)
-        cursor = self.__cur.execute(f'SELECT * FROM {table_name} WHERE {conditions};', dictionary)
+        query = select_statement(table_name, tuple(dictionary))
+        cursor = self.__cur.execute(query, dictionary)
         columns = [c[0] for c in cursor.description]
         rows = cursor.fetchall()
         return self.extract_to_dictionaries(columns, rows)
     
 
+    def iter_full_table(self,
+                        table_name: str,
+                        chunk_size: int = DEFAULT_CHUNK_SIZE,
+                        row_format: RowFormat = RowFormat.DICT
+                        ) -> Iterator[Any]:
+        '''
+        Stream a table in chunks of up to chunk_size rows, each chunk a list 
+        of dicts, a list of tuples or a record array (see RowFormat). Only one
+        chunk is held in memory at a time.
+        '''
+        return self.__iter_chunks(table_name, f'SELECT * FROM {table_name} ;', {}, 
+                                  chunk_size, row_format)
+
+
+    def iter_filtered_table(self,
+                            table_name: str,
+                            dictionary: dict[str, ImmutableType],
+                            chunk_size: int = DEFAULT_CHUNK_SIZE,
+                            row_format: RowFormat = RowFormat.DICT
+                            ) -> Iterator[Any]:
+        query = select_statement(table_name, tuple(dictionary))
+        return self.__iter_chunks(table_name, query, dictionary, chunk_size, row_format)
+
+
+    def record_dtype(self, table_name: str, columns: list[str]) -> np.dtype:
+        '''
+        The record array dtype for columns of a table, from the types the
+        table declares (see column_dtype), so every chunk of a stream gets
+        the same fields whatever values it happens to hold.
+        '''
+        declared = {row[1]: row[2] for row in self.__cur.execute(f'PRAGMA table_info({table_name});')}
+        return np.dtype([(column, column_dtype(declared.get(column, ''))) for column in columns])
+
+
+    def __iter_chunks(self,
+                      table_name: str,
+                      query: str,
+                      dictionary: BasicDict,
+                      chunk_size: int,
+                      row_format: RowFormat
+                      ) -> Iterator[Any]:
+        if chunk_size < 1:
+            raise ValueError('Chunk size must be at least 1.')
+        # A cursor of its own, so other queries can run while the stream is open.
+        cursor = self.__con.execute(query, dictionary)
+        columns = [c[0] for c in cursor.description]
+        if row_format == RowFormat.RECORDS:
+            dtype = self.record_dtype(table_name, columns)
+        try:
+            while rows := cursor.fetchmany(chunk_size):
+                if row_format == RowFormat.DICT:
+                    yield self.extract_to_dictionaries(columns, rows)
+                elif row_format == RowFormat.RECORDS:
+                    yield to_records(rows, dtype)
+                else:
+                    yield rows
+        finally:
+            cursor.close()
+
+
     @staticmethod
     def extract_to_dictionaries(columns: list[str], rows: list[Any]) -> list[BasicDict]:
         table_rows: list[BasicDict] = []
@@ -62,19 +285,45 @@ class DatabaseManager:
             raise e
 
 
+    def execute_many(self, query: str, rows: list[BasicDict], operation: str | None = None) -> None:
+        operation = operation or 'UNSPECIFIED'
+        try:
+            self.__cur.executemany(query, rows)
+            logger.debug(f'Database {operation} of {len(rows)} rows successfully added to next commit.')
+
+        except sqlite3.Error as e:
+            logger.debug(f'Database {operation} of {len(rows)} rows failed: {e}')
+            raise e
+
+
     def insert_table_from_dict(self, table_name: str, dictionary: BasicDict) -> None:
-        keys, keyrefs = SQL_keyrefs_insert(dictionary)
-        query = f'INSERT INTO {table_name}({keys}) VALUES ({keyrefs}); '
+        query = insert_statement(table_name, tuple(dictionary))
         self.execute(query, dictionary, 'INSERT')
 
 
     def update_table_from_dict(self, table_name: str, primary_key: str, dictionary: BasicDict) -> None:
-        primary_value = dictionary[primary_key]
-        values = ', '.join([f'{k}=:{k}' for k in dictionary])
-        query = f'UPDATE {table_name} SET {values} WHERE {primary_key} = "{primary_value}"; '
+        query = update_statement(table_name, primary_key, tuple(dictionary))
         self.execute(query, dictionary, 'UPDATE')
 
 
+    def insert_many(self, table_name: str, rows: list[BasicDict]) -> None:
+        '''
+        Insert many rows, with one executemany per distinct set of columns.
+        Like execute, the rows wait for the next commit.
+        '''
+        for columns, group in group_by_columns(rows).items():
+            self.execute_many(insert_statement(table_name, columns), group, 'INSERT')
+
+
+    def update_many(self, table_name: str, primary_key: str, rows: list[BasicDict]) -> None:
+        '''
+        Update many rows by primary key, with one executemany per distinct set
+        of columns. Like execute, the changes wait for the next commit.
+        '''
+        for columns, group in group_by_columns(rows).items():
+            self.execute_many(update_statement(table_name, primary_key, columns), group, 'UPDATE')
+
+
     def create_table_from_dict(self, 
                                table_name: str, 
                                primary_key: str, 
@@ -100,64 +349,66 @@ class DatabaseManager:
                 user_uuid: str,
                 width: int,
                 height: int,
+                bulk_load: bool = False
                 # resource_ranges: dict[str, tuple[int, int]]
                 ) -> None:
-      
+        '''
+        Create a map for the user and write all of its tiles and resources in
+        one transaction. With bulk_load, BULK_LOAD_PRAGMAS are in force while
+        the map is written.
+        '''
         logger.debug('Checking valid user UUID.')
-        columns = self.get_full_table('user_uuids')
-        uuids = [row['user_uuid'] for row in columns]
-        if not user_uuid in uuids:
+        if not self.user_exists(user_uuid):
             raise ValueError('Unknown user UUID.')
 
-        map_uuid: str = str(uuid4())
-        tile_uuid: str
-
-        logger.debug('Creating new map id for user')
-        self.insert_table_from_dict('maps', {'map_uuid': map_uuid,
-                                             'user_uuid': user_uuid})
-
-        for x in range(1, width + 1):
-            for y in range(1, height + 1):
-
-                logger.debug(f'Generating tile details for coordinates {x, y}')
-                tile_uuid = str(uuid4())
-
-                logger.debug(f'Creating random resource profile for tile {tile_uuid}...')
-                resources: BasicDict = test_get_random_resources()
-                assert isinstance(resources, dict)
-
-               
-                resources.update({'tile_uuid': tile_uuid})
-                tile = {'tile_uuid': tile_uuid,
-                        'map_uuid': map_uuid,
-                        'x': x,
-                        'y': y,
-                        # 'resource_multiplier': 2,
-                        # 'movement_multiplier': 2,
-                        # 'occupier_uuid': None,
-                        # 'is_mountain': False,
-                        # 'is_water': False
-                        }
-                
-                logger.debug('Writing tile to database')
-                try:
-                    self.insert_table_from_dict('tiles', tile)
-                except sqlite3.Error as e:
-                    logger.debug(e)
+        with self.pragmas(BULK_LOAD_PRAGMAS if bulk_load else {}):
+            self.__write_map(user_uuid, width, height)
+
+
+    def __write_map(self, user_uuid: str, width: int, height: int) -> None:
+        count = width * height
+        xs, ys = (np.indices((width, height)).reshape(2, count) + 1).tolist()
+        tile_uuids = [str(uuid4()) for _ in range(count)]
+        names, amounts = test_get_random_resource_table(count)
+
+        logger.debug(f'Writing map for user {user_uuid} with {count} tiles to database.')
+        try:
+            with self.__con:
+                self.__cur.executemany('INSERT INTO tiles(tile_uuid, user_uuid, x, y) '
+                                       'VALUES (?, ?, ?, ?);',
+                                       zip(tile_uuids, repeat(user_uuid), xs, ys))
+                self.__write_resources(tile_uuids, names, amounts)
+        except sqlite3.Error as e:
+            logger.debug(f'Map creation failed and was rolled back: {e}')
+            raise e
+
+        logger.debug('Committed map to database.')
 
-                logger.debug(f'Writing tile resources to database {resources}')
-                try:
-                    self.insert_table_from_dict('resources', resources)
-                except sqlite3.Error as e:
-                    logger.debug(e)
+    def __write_resources(self, 
+                          tile_uuids: list[str], 
+                          names: list[str], 
+                          amounts: np.ndarray
+                          ) -> None:
+        if self.resource_storage == ResourceStorage.SPARSE:
+            ids = np.array([resource_ids[name] for name in names], dtype=np.int64)
+            tiles, columns = np.nonzero(amounts)
+            self.__cur.executemany('INSERT INTO tile_resource(tile_uuid, resource_id, amount) '
+                                   'VALUES (?, ?, ?);',
+                                   zip([tile_uuids[t] for t in tiles.tolist()],
+                                       ids[columns].tolist(),
+                                       amounts[tiles, columns].tolist()))
+            return
+        columns = ', '.join(['tile_uuid', *names])
+        references = ', '.join('?' * (len(names) + 1))
+        self.__cur.executemany(f'INSERT INTO resources({columns}) VALUES ({references});',
+                               ((t, *row) for t, row in zip(tile_uuids, amounts.tolist())))
 
-        logger.debug('Committing database transaction.')
-        self.commit()
 
 def test_setup(w: int, h: int): 
     setup_database(TEST_DATABASE)
 
-    b = DatabaseManager(TEST_DATABASE)
-    b.insert_table_from_dict('user_uuids', {'user_uuid': 'TEST_USER_001'})
-    b.new_map('TEST_USER_001', w, h)
+    b = DatabaseManager(TEST_DATABASE, 'TEST_USER_001')
+    if not b.user_exists('TEST_USER_001'):
+        b.insert_table_from_dict('users', {'user_uuid': 'TEST_USER_001'})
+        b.new_map('TEST_USER_001', w, h)
 
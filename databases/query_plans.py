@@ -0,0 +1,87 @@
+'''
+Print SQLite's EXPLAIN QUERY PLAN for the hot queries, so a query that falls
+back to a full table scan shows up as "SCAN" instead of "SEARCH ... USING
+INDEX".
+
+Run from the repository root:  python -m databases.query_plans [db_address]
+
+Without an address, both schemas (the ORM models and the hand-written tables
+in setup.py) are built in scratch databases and checked.
+'''
+import os
+import sqlite3
+import sys
+from tempfile import TemporaryDirectory
+
+from loguru import logger
+from sqlalchemy import Engine, Select, create_engine, select
+
+from databases.alchemy_controller import region_totals_statement, tile_statements, user_statement
+from databases.setup import setup_database
+from databases.sqlalchemy_models import Base, Tile
+from src.civ_api.constants.enums import ResourceStorage
+
+
+USER = 'PLAN_USER'
+
+
+def orm_queries() -> dict[str, Select]:
+    return {'user by uuid': user_statement(USER),
+            'tiles for user': select(Tile).where(Tile.user_uuid == USER),
+            'tile at (x, y)': select(Tile).where((Tile.user_uuid == USER) &
+                                                 (Tile.x == 3) & (Tile.y == 4)),
+            'tiles with resources by uuid': next(tile_statements(USER, ['a', 'b', 'c'])),
+            'sparse tiles with resources by uuid': next(tile_statements(USER, ['a', 'b', 'c'],
+                                                                        ResourceStorage.SPARSE)),
+            'region totals (wide)': region_totals_statement(USER, 0, 0, 9, 9, ResourceStorage.WIDE),
+            'region totals (sparse)': region_totals_statement(USER, 0, 0, 9, 9, ResourceStorage.SPARSE)}
+
+
+SETUP_QUERIES: dict[str, str] = {
+    'tiles for user': f"SELECT * FROM tiles WHERE user_uuid = '{USER}';",
+    'tile at (x, y)': f"SELECT * FROM tiles WHERE user_uuid = '{USER}' AND x = 3 AND y = 4;",
+    'resources for user': ("SELECT r.* FROM tiles t JOIN resources r ON r.tile_uuid = t.tile_uuid "
+                           f"WHERE t.user_uuid = '{USER}';"),
+}
+
+
+def print_plan(title: str, plan: list[tuple]) -> None:
+    print(f'  {title}')
+    for row in plan:
+        print(f'      {row[-1]}')
+
+
+def explain_orm(engine: Engine) -> None:
+    print(f'ORM schema ({engine.url})')
+    with engine.connect() as connection:
+        for title, statement in orm_queries().items():
+            sql = str(statement.compile(engine, compile_kwargs={'literal_binds': True}))
+            print_plan(title, connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {sql}').all())
+
+
+def explain_setup(database_path: str) -> None:
+    print(f'setup.py schema ({database_path})')
+    connection = sqlite3.connect(database_path)
+    for title, sql in SETUP_QUERIES.items():
+        print_plan(title, connection.execute(f'EXPLAIN QUERY PLAN {sql}').fetchall())
+    connection.close()
+
+
+def main(db_address: str | None = None) -> None:
+    if db_address is not None:
+        explain_orm(create_engine(db_address))
+        return
+
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(engine)
+    explain_orm(engine)
+
+    logger.disable('databases.setup')
+    with TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'query_plans.db')
+        setup_database(path)
+        explain_setup(path)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1] if len(sys.argv) > 1 else None)
@@ -6,7 +6,7 @@ from uuid import uuid4
 from loguru import logger
 
 
-from src.civ_api.constants import Resources
+from src.civ_api.constants import Resources, ResourceStorage
 from src.civ_api.functions import vals
 from src.civ_api.type_aliasing import (ImmutableType, 
                                        BasicDict, 
@@ -18,7 +18,13 @@ TEST_DATABASE = 'databases/test.db'
 
 
 
-def setup_database(database_path: str) -> None:
+def setup_database(database_path: str, 
+                   resource_storage: ResourceStorage = ResourceStorage.WIDE
+                   ) -> None:
+    '''
+    Create the game tables. Resources get the table of the chosen layout
+    (see ResourceStorage): resources for WIDE, tile_resource for SPARSE.
+    '''
     con: sqlite3.Connection = sqlite3.connect(database_path)
     cur: sqlite3.Cursor = con.cursor()
 
@@ -57,6 +63,19 @@ def setup_database(database_path: str) -> None:
                 );
                 """
     
+    # resource_id is the resource's fixed id from constants.resources.resource_ids.
+    tile_resources = """
+                CREATE TABLE IF NOT EXISTS tile_resource
+                (
+                tile_uuid TEXT NOT NULL,
+                resource_id INT NOT NULL,
+                amount INT NOT NULL,
+                PRIMARY KEY (tile_uuid, resource_id),
+
+                FOREIGN KEY(tile_uuid) REFERENCES tiles(tile_uuid)
+                ) WITHOUT ROWID;
+                """
+    
     abstract_units = """
                 CREATE TABLE IF NOT EXISTS abstract_units
                 (
@@ -82,11 +101,20 @@ def setup_database(database_path: str) -> None:
                 """
     
 
+    # Serves both "tiles for this user" (as a prefix) and "tile at (x, y)".
+    # The units table has no owner or coordinates yet; give it the same 
+    # index once it does.
+    tiles_by_user_xy = """
+                CREATE UNIQUE INDEX IF NOT EXISTS ix_tiles_user_xy 
+                ON tiles(user_uuid, x, y);
+                """
+
     setup_tables = [user_uuids, 
                     tiles, 
-                    resources, 
+                    tile_resources if resource_storage == ResourceStorage.SPARSE else resources, 
                     abstract_units, 
-                    concrete_units]
+                    concrete_units,
+                    tiles_by_user_xy]
     
     for x in setup_tables:
         logger.debug(f'Creating table with SQL query: {x}')
@@ -4,7 +4,8 @@ from typing import (Callable,
                     Any)
 
 from sqlalchemy import (create_engine,
-                        ForeignKey)
+                        ForeignKey,
+                        Index)
 
 from sqlalchemy.orm import (DeclarativeBase,
                             Mapped,
@@ -50,6 +51,8 @@ class User(Base):
 
 class Tile(Base):
     __tablename__ = "tile"
+    # Serves both "tiles for this user" (as a prefix) and "tile at (x, y)".
+    __table_args__ = (Index('ix_tile_user_xy', 'user_uuid', 'x', 'y', unique=True),)
 
     tile_uuid: Mapped[str] = mapped_column(primary_key=True)
     user_uuid: Mapped[str] = mapped_column(ForeignKey("user.user_uuid"))
@@ -57,7 +60,9 @@ class Tile(Base):
     x: Mapped[int]
     y: Mapped[int]
     parent: Mapped["User"] = relationship(back_populates='tiles')
-    resource: Mapped["Resource"] = relationship(back_populates="tile")
+    # Resources are always wanted with their tile; 'selectin' fetches them for
+    # every tile loaded by a query in batched IN queries instead of one by one.
+    resource: Mapped["Resource"] = relationship(back_populates="tile", lazy='selectin')
     # owner: Mapped[Optional["Empire"]] = relationship(back_populates='tiles')
 
     def __repr__(self) -> str:
@@ -126,3 +131,19 @@ class Resource(Base):
         return r
 
 
+class TileResource(Base):
+    '''
+    Sparse resource storage: one row per resource a tile actually has, with 
+    resource_id being the resource's fixed id from constants.resources.resource_ids.
+    '''
+    __tablename__ = "tile_resource"
+    # The primary key is the whole row, so there is no point keeping a rowid.
+    __table_args__ = {'sqlite_with_rowid': False}
+
+    tile_uuid:   Mapped[str] = mapped_column(ForeignKey("tile.tile_uuid"),
+                                             primary_key=True)
+    resource_id: Mapped[int] = mapped_column(primary_key=True)
+    amount:      Mapped[int]
+
+    def __repr__(self) -> str:
+        return f'TileResource @ tile {self.tile_uuid} :: {self.resource_id}: {self.amount}'
@@ -1,10 +1,14 @@
 
+import numpy as np
 from dataclasses import dataclass
 from loguru import logger
+from numpy.typing import NDArray
 from typing import Any, Callable, Optional, TypedDict
 
 from .entities import City, Entity
-from .protocols import DoesOccupyCoordinates
+from .neighbourhood import batch_neighbours
+from .occupancy import OccupancyIndex
+from .tile_store import EMPTY, RESOURCE_COLUMNS, TileStore
 from .type_aliasing import Coords
 
 X = 'x'
@@ -15,6 +19,8 @@ class Tile():
     '''
     A square on a cartesian map.
     '''
+    __slots__ = ('uuid', 'x', 'y', 'resources', 'resource_multiplier', 
+                 'movement_multiplier', 'occupier_uuid', 'is_mountain', 'is_water')
 
     def __init__(
             self,
@@ -64,6 +70,89 @@ class Tile():
         return (self.x, self.y)
 
 
+class TileView(Tile):
+    '''
+    A tile that reads and writes through to its row in a TileStore.
+
+    Views are cheap to make and hold no tile data of their own, so changes
+    made through a view land directly in the map. The occupier is the
+    exception: it follows the map's OccupancyIndex, so it is read-only here
+    and entities are moved with Map.place_entity, move_entity and
+    remove_entity instead.
+    '''
+    __slots__ = ('store', 'row')
+
+    def __init__(self, store: TileStore, row: int) -> None:
+        self.store: TileStore = store
+        self.row: int = row
+
+    @property
+    def uuid(self) -> str:
+        return self.store.uuids[self.row]
+
+    @property
+    def x(self) -> int:
+        return int(self.store.x[self.row])
+
+    @property
+    def y(self) -> int:
+        return int(self.store.y[self.row])
+
+    @property
+    def resources(self) -> dict[str, int]:
+        return self.store.get_resources(self.row)
+
+    @resources.setter
+    def resources(self, resources: dict[str, int]) -> None:
+        self.store.set_resources(self.row, resources)
+
+    @property
+    def resource_multiplier(self) -> int:
+        return int(self.store.resource_multiplier[self.row])
+
+    @resource_multiplier.setter
+    def resource_multiplier(self, value: int) -> None:
+        self.store.resource_multiplier[self.row] = value
+        self.store.touch(self.row)
+
+    @property
+    def movement_multiplier(self) -> int:
+        return int(self.store.movement_multiplier[self.row])
+
+    @movement_multiplier.setter
+    def movement_multiplier(self, value: int) -> None:
+        self.store.movement_multiplier[self.row] = value
+        self.store.touch(self.row, terrain=True)
+
+    @property
+    def occupier_uuid(self) -> Optional[str]:
+        return self.store.occupier_uuid[self.row]
+
+    def depart(self, occupier_uuid: str):
+        raise ValueError('Tile occupiers follow the map; use Map.move_entity or remove_entity.')
+
+    def arrive(self, occupier_uuid: str) -> None:
+        raise ValueError('Tile occupiers follow the map; use Map.place_entity or move_entity.')
+
+    @property
+    def is_mountain(self) -> bool:
+        return bool(self.store.is_mountain[self.row])
+
+    @is_mountain.setter
+    def is_mountain(self, value: bool) -> None:
+        self.store.is_mountain[self.row] = value
+        self.store.touch(self.row, terrain=True)
+
+    @property
+    def is_water(self) -> bool:
+        return bool(self.store.is_water[self.row])
+
+    @is_water.setter
+    def is_water(self, value: bool) -> None:
+        self.store.is_water[self.row] = value
+        self.store.touch(self.row, terrain=True)
+
+
 class TileDict(TypedDict):
     uuid: str
     x: int
@@ -80,33 +169,97 @@ class Map:
     def __init__(self,
                  width: int,
                  height: int,
-                 tiles: dict[str, TileDict] | None = None
+                 tiles: dict[str, TileDict] | None = None,
+                 store: TileStore | None = None,
+                 grid: NDArray[np.int32] | None = None
                  ) -> None:
-
+        '''
+        A store and grid may be passed in together to back the map with data
+        that already exists (see snapshot.open_snapshot).
+        '''
         self.width: int = width
         self.height: int = height
-        self.tiles: dict[str, TileDict] = tiles or {}
+        self.store: TileStore = store if store is not None else TileStore(width * height)
         self.callbacks: dict[str, Callable[..., Any]]
 
+        # Dense coordinate index: the store row of the tile at grid[x, y],
+        # or EMPTY where no tile has been added.
+        if grid is None:
+            grid = np.full((width, height), EMPTY, dtype=np.int32)
+        self.grid: NDArray[np.int32] = grid
+        self.occupancy: OccupancyIndex = OccupancyIndex(width, height)
+
+        for tile in (tiles or {}).values():
+            self.add_tile(tile)
+
+
+    @property
+    def tiles(self) -> dict[str, TileDict]:
+        '''Copy of every tile on the map, keyed by uuid.'''
+        return {uuid: TileDict(**self.store.to_dict(row)) 
+                for uuid, row in self.store.rows.items()}
+
+
+    def in_bounds(self, coords: Coords) -> bool:
+        x, y = coords
+        return 0 <= x < self.width and 0 <= y < self.height
+
 
     def tile_is_valid(self, tile: Tile) -> bool:
-        if not tile.uuid in self.tiles:
-            return not all([tile.x > self.width,
-                            tile.y > self.height,
-                            tile.x < 0,
-                            tile.y < 0])
+        if not tile.uuid in self.store and self.in_bounds(tile.coords):
+            return self.grid[tile.coords] == EMPTY
         return False
 
 
     def add_tile(self, tile: TileDict) -> None:
         tile_ = Tile(**tile)
         if self.tile_is_valid(tile_):
-            self.tiles.update({tile_.uuid: tile})
+            self.grid[tile_.coords] = self.store.append(**tile)
             logger.debug(f'Added to map tile with ID: {tile_.uuid}')
+            return
 
         logger.debug('Tile could not be added to map.')
 
 
+    def place_entity(self, entity: Entity, carrier_uuid: Optional[str] = None) -> None:
+        '''Put an entity on the map, on its own tile or inside a carrier.'''
+        self.occupancy.place(entity, carrier_uuid)
+        self.__sync_occupier(entity.coords)
+
+
+    def move_entity(self, 
+                    entity: Entity, 
+                    coords: Coords, 
+                    carrier_uuid: Optional[str] = None
+                    ) -> None:
+        '''Move an entity that is on the map, placing it first if it is not.'''
+        if entity.instance_uuid not in self.occupancy:
+            entity.x, entity.y = coords
+            self.place_entity(entity, carrier_uuid)
+            return
+        origin = entity.coords
+        self.occupancy.move(entity.instance_uuid, coords, carrier_uuid)
+        self.__sync_occupier(origin)
+        self.__sync_occupier(entity.coords)
+
+
+    def remove_entity(self, entity: Entity) -> None:
+        '''Take an entity, and anything it carries, off the map.'''
+        coords = entity.coords
+        self.occupancy.remove(entity.instance_uuid)
+        self.__sync_occupier(coords)
+
+
+    def get_entities_at(self, coords: Coords) -> list[Entity]:
+        return self.occupancy.at(coords)
+
+
+    def __sync_occupier(self, coords: Coords) -> None:
+        # The tile's occupier is whatever stands on it directly.
+        if self.in_bounds(coords) and self.grid[coords] != EMPTY:
+            self.store.set_occupier(int(self.grid[coords]), self.occupancy.ground_uuid(coords))
+
+
     def get_tile_uuid(self, search: Tile | Coords | Entity | Any) -> str | None:
         '''Find the tile uuid for a given object, if it exists.'''
         if isinstance(search, Tile):
@@ -117,43 +270,107 @@ class Map:
         if isinstance(search, tuple):
             if len(search) == 2 and all(list(map(lambda x : isinstance(x, int), search))):
                 try:
-                    self.get_tile_uuid_from_coords(search)
+                    return self.get_tile_uuid_from_coords(search)
                 except ValueError as e:
                     logger.debug(f'Unable to get tile uuid. Error: {e}')
         else:
             logger.debug(f'Unable to get tile uuid: unknown request type [ {search} :: {type(search)} ]')
 
 
+    def get_row_from_coords(self, coords: Coords) -> int:
+        if not self.in_bounds(coords):
+            raise ValueError(f'Coordinates {coords} are outside the map.')
+        row = int(self.grid[coords])
+        if row == EMPTY:
+            raise ValueError(f'No tile found at coordinates {coords}')
+        return row
     
+
     def get_tile_uuid_from_coords(self, coords: Coords) -> str:
-        for uuid, data in self.tiles.items():
-            if (data[X], data[Y]) == coords:
-                return uuid
-        raise ValueError(f'No tile found at coordinates {coords}')
+        return self.store.uuids[self.get_row_from_coords(coords)]
     
 
     def get_tile_from_coords(self, coords: Coords) -> Tile | None:
         try:
-            return self.get_tile_from_uuid(self.get_tile_uuid_from_coords(coords))
+            return TileView(self.store, self.get_row_from_coords(coords))
         except ValueError as e:
             logger.debug(f'Unable to create tile. Error: {e}')
 
 
     def get_tile_from_uuid(self, uuid: str) -> Tile | None:
-        if uuid in self.tiles:
-            return Tile(**self.tiles[uuid])
+        if uuid in self.store:
+            return TileView(self.store, self.store.rows[uuid])
         logger.debug(f'No tile found with ID: {uuid}')
 
 
+    def get_rows_at(self, coords_list: list[Coords]) -> NDArray[np.int32]:
+        '''
+        Resolve many coordinates to store rows in one array operation. 
+        Coordinates that are off the map or hold no tile resolve to EMPTY, so
+        the result lines up with the request.
+        '''
+        coords = np.asarray(coords_list, dtype=np.int64).reshape(-1, 2)
+        xs, ys = coords[:, 0], coords[:, 1]
+        inside = (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
+        rows = np.full(len(coords), EMPTY, dtype=np.int32)
+        rows[inside] = self.grid[xs[inside], ys[inside]]
+        return rows
+
+
+    def get_tiles_at(self, coords_list: list[Coords]) -> list[Tile | None]:
+        '''
+        Resolve many coordinates in one pass. Coordinates that are off the map
+        or hold no tile resolve to None, so the result lines up with the request.
+        '''
+        store = self.store
+        return [TileView(store, row) if row != EMPTY else None 
+                for row in self.get_rows_at(coords_list).tolist()]
+
+
+    def get_neighbour_rows(self,
+                           coords_list: list[Coords],
+                           radius: int = 1,
+                           ring: bool = False
+                           ) -> NDArray[np.int32]:
+        '''
+        Get the store rows around many tiles in one array operation.
+
+        Returns an (N x K) table, one row per requested tile and one column 
+        per offset in the radius (or ring); cells off the map are EMPTY.
+        '''
+        cells, inside = batch_neighbours(coords_list, self.width, self.height, radius, ring)
+        rows = np.full(inside.shape, EMPTY, dtype=np.int32)
+        rows[inside] = self.grid[cells[..., 0][inside], cells[..., 1][inside]]
+        return rows
+
+
+    def get_neighbouring_tiles(self, 
+                               coords: Coords, 
+                               radius: int = 1, 
+                               ring: bool = False
+                               ) -> list[Tile]:
+        '''Get the tiles within the radius of the given coordinates.'''
+        store = self.store
+        return [TileView(store, row) 
+                for row in self.get_neighbour_rows([coords], radius, ring)[0].tolist()
+                if row != EMPTY]
+
+
     def get_total_resources(self, list_of_coords: list[Coords]) -> dict[str, int]:
         '''
         Get the total resources of all tiles within a city's sphere of influence.
         '''
-        # resources: dict[str, int] = {}
-        # for tile_ in tiles:
-        #     tile = Tile(**self.tiles[tile_])
-        #     for resource, amount in tile.resources.items():
-        #         before: int = resources.get(resource, 0)
-        #         resources[resource] = before + amount
-        #     del (tile)
-        # return resources
+        totals = self.get_resource_totals([list_of_coords])[0]
+        return {RESOURCE_COLUMNS[i]: int(totals[i]) for i in np.flatnonzero(totals)}
+
+
+    def get_resource_totals(self, coords_lists: list[list[Coords]]) -> NDArray[np.int64]:
+        '''
+        Get the total resources for many cities at once, one list of 
+        coordinates per city.
+
+        Returns a (cities x resources) table whose columns follow 
+        RESOURCE_COLUMNS, with each tile's resource multiplier applied.
+        '''
+        return self.store.total_resources([self.get_rows_at(coords) 
+                                           for coords in coords_lists])
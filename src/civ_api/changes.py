@@ -0,0 +1,94 @@
+'''Per-turn change sets, so clients can catch up without refetching the game.'''
+
+from collections import OrderedDict
+from collections.abc import Iterable
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+from .type_aliasing import Coords
+
+
+DEFAULT_CHANGE_HISTORY = 32
+
+
+@dataclass
+class TurnChanges:
+    '''
+    What changed over one or more turns. units maps each unit that moved to
+    where it ended up, or to None if it left the map.
+    '''
+    turn: int
+    tiles: set[str] = field(default_factory=set)
+    units: dict[str, Optional[Coords]] = field(default_factory=dict)
+    cities: set[str] = field(default_factory=set)
+
+    def __bool__(self) -> bool:
+        return bool(self.tiles or self.units or self.cities)
+
+    def merge(self, later: 'TurnChanges') -> None:
+        '''Fold the changes of a later turn into these ones.'''
+        self.turn = later.turn
+        self.tiles |= later.tiles
+        self.units.update(later.units)
+        self.cities |= later.cities
+
+    def to_dict(self) -> dict[str, object]:
+        return {'turn': self.turn,
+                'tiles': sorted(self.tiles),
+                'units': {uuid: coords for uuid, coords in sorted(self.units.items())},
+                'cities': sorted(self.cities)}
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> 'TurnChanges':
+        '''Rebuild changes from to_dict's output, e.g. after a trip through JSON.'''
+        return cls(data['turn'],
+                   set(data['tiles']),
+                   {uuid: None if coords is None else (coords[0], coords[1])
+                    for uuid, coords in data['units'].items()},
+                   set(data['cities']))
+
+
+class ChangeLog:
+    '''
+    Keeps the changes of the last few turns, one TurnChanges per turn.
+
+    Changes are recorded against the turn under way; since(turn) merges
+    everything from that turn on into one set. A client asking about a turn
+    older than the history kept gets None and has to fetch everything.
+    '''
+
+    def __init__(self, history: int = DEFAULT_CHANGE_HISTORY) -> None:
+        self.history: int = history
+        self.turns: OrderedDict[int, TurnChanges] = OrderedDict()
+
+    def current(self, turn: int) -> TurnChanges:
+        if turn not in self.turns:
+            if self.turns and turn < next(reversed(self.turns)):
+                raise ValueError(f'Turn {turn} is older than the turns being recorded.')
+            self.turns[turn] = TurnChanges(turn)
+            while len(self.turns) > self.history:
+                self.turns.popitem(last=False)
+        return self.turns[turn]
+
+    def load(self, turns: Iterable[TurnChanges]) -> None:
+        '''
+        Take in saved change sets (e.g. replayed from the journal), oldest
+        first, ahead of anything recorded here already.
+        '''
+        recorded = list(self.turns.values())
+        self.turns.clear()
+        for changes in [*turns, *recorded]:
+            self.current(changes.turn).merge(changes)
+
+    def since(self, turn: int, current_turn: int) -> Optional[TurnChanges]:
+        if turn > current_turn:
+            raise ValueError(f'Turn {turn} has not happened yet.')
+        oldest = next(iter(self.turns), current_turn)
+        if turn < oldest:
+            return None
+        merged = TurnChanges(turn)
+        for changes in self.turns.values():
+            if changes.turn >= turn:
+                merged.merge(changes)
+        merged.turn = current_turn
+        return merged
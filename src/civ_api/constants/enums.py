@@ -97,4 +97,38 @@ class DatabaseTables(StrEnum):
     TILES = auto()
     RESOURCES = auto()
     ABSTRACT_LOOKUP = auto()
-    ABSTRACT_UNITS = auto()
\ No newline at end of file
+    ABSTRACT_UNITS = auto()
+
+
+class ResourceStorage(StrEnum):
+    '''
+    How tile resources are laid out in the database.
+
+    WIDE keeps one nullable column per resource. SPARSE keeps one
+    (tile, resource, amount) row per resource a tile actually has.
+    '''
+    WIDE = auto()
+    SPARSE = auto()
+
+
+class RowFormat(StrEnum):
+    '''
+    How streamed database rows are handed back: as dictionaries keyed by
+    column, as plain tuples, or as one NumPy record array per chunk.
+    '''
+    DICT = auto()
+    TUPLE = auto()
+    RECORDS = auto()
+
+
+class TurnStages(StrEnum):
+    '''
+    The stages of end-of-turn processing, in the order they run. 
+    
+    A paused turn records the stage it stopped in, so it can pick up there.
+    '''
+    PLAN_ORDERS = auto()
+    EMPIRE_TURNS = auto()
+    APPLY_ORDERS = auto()
+    COMMIT = auto()
+    DONE = auto()
@@ -7,3 +7,37 @@ resource_minmax: ResourceRanges = {'iron': (1, 5),
                                    'sheep': (1, 5),
                                    'wild_game': (1, 5),
                                    'cattle': (1, 5)}
+
+
+# Ids of the resources in sparse storage (the tile_resource table). They are
+# part of the stored data, so they are fixed here rather than taken from the
+# order of the Resources enum: a new resource gets a new id, and an id is
+# never reused or changed.
+resource_ids: dict[str, int] = {'wheat': 0,
+                                'water': 1,
+                                'stone': 2,
+                                'marble': 3,
+                                'iron': 4,
+                                'coal': 5,
+                                'gems': 6,
+                                'horses': 7,
+                                'cattle': 8,
+                                'sheep': 9,
+                                'fish': 10,
+                                'pearls': 11,
+                                'wild_game': 12,
+                                'sugar': 13,
+                                'farming': 14,
+                                'salt': 15,
+                                'gold': 16,
+                                'silver': 17,
+                                'wood': 18,
+                                'clay': 19,
+                                'olives': 20,
+                                'grapes': 21,
+                                'fruit': 22,
+                                'ivory': 23,
+                                'silk': 24,
+                                'spices': 25,
+                                'dyes': 26,
+                                'incense': 27}
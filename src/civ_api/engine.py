@@ -1,17 +1,27 @@
 '''Main game object.'''
 
+import os
+from collections import OrderedDict
 from uuid import uuid4
+from loguru import logger
 from typing import Any, Protocol
 
-from databases.setup import DatabaseManager
+from databases.controller import DatabaseManager
 
 from . import events
-from .cartography import Tile
+from .cartography import Map, Tile
+from .changes import ChangeLog, TurnChanges
 from .classes import DiplomaticRelations
-from .constants.enums import GamePhases, DiplomaticStatus
-from .entities import Unit, City
+from .constants.enums import GamePhases, DiplomaticStatus, ResourceStorage, TurnStages
+from .entities import Entity, Unit, City
 from .functions import get_neighbouring_tiles
-from .type_aliasing import ImmutableType, BasicDict
+from .journal import EventJournal
+from .pathfinding import Pathfinder
+from .snapshot import open_snapshot, write_snapshot
+from .turns import (TurnCheckpoint, TurnOrder, TurnPlanner, TurnState, merge_orders, 
+                    read_checkpoint, write_checkpoint)
+from .type_aliasing import Coords, ImmutableType, BasicDict
+from .visibility import DEFAULT_SIGHT_RADIUS, Visibility
 
 
 class UserOrder:
@@ -26,26 +36,136 @@ class Abstraction:
     ...
 
 
-class DatabaseStrategy():
+# Primary key column of each table DatabaseStrategy reads by uuid.
+TABLE_KEYS: dict[str, str] = {'users': 'user_uuid',
+                              'tiles': 'tile_uuid',
+                              'resources': 'tile_uuid',
+                              'abstract_units': 'abstract_uuid',
+                              'units': 'unit_uuid',
+                              'cities': 'city_uuid'}
+
+DEFAULT_CACHE_SIZE = 4096
+
+# Tile fields a paused turn carries in its checkpoint (see Game.resume_turn).
+RESTORED_TILE_FIELDS: tuple[str, ...] = ('resources', 'resource_multiplier', 'movement_multiplier',
+                                         'is_mountain', 'is_water')
 
-    def __init__(self, master: 'Game') -> None:
+
+class DatabaseStrategy():
+    '''
+    Reads and writes game state for one user, rebuilding game objects from
+    their rows on demand.
+
+    Rows are kept in a bounded LRU cache keyed by (table, uuid), since most
+    requests read the same few tiles and cities again and again. Writes go
+    through update, which refreshes any cached copy of the row, so the cache
+    never serves a row older than the last write made through this strategy.
+
+    Between begin_batch and flush, updates are held back instead of written:
+    repeated updates to one row are merged into a single pending row, and
+    flush writes them all in one transaction. Reads during the batch see the
+    pending values.
+    '''
+
+    def __init__(self, master: 'Game', cache_size: int = DEFAULT_CACHE_SIZE) -> None:
         self.user_uuid: str = master.user_uuid
         self.database_manager: DatabaseManager
+        self.cache_size: int = cache_size
+        self.rows: OrderedDict[tuple[str, str], BasicDict] = OrderedDict()
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+        self.batching: bool = False
+        self.pending: dict[str, dict[str, BasicDict]] = {}
     
 
     def set_user(self, user_uuid: str) -> None:
+        if user_uuid != self.user_uuid:
+            self.invalidate()
         self.user_uuid = user_uuid
+
+
+    def cache_stats(self) -> dict[str, int]:
+        return {'size': len(self.rows),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions}
+
+
+    def invalidate(self, table_name: str | None = None, table_key: str | None = None) -> None:
+        '''Drop one cached row, every row of a table, or (by default) everything.'''
+        if table_name is None:
+            self.rows.clear()
+        elif table_key is None:
+            for key in [key for key in self.rows if key[0] == table_name]:
+                del self.rows[key]
+        else:
+            self.rows.pop((table_name, table_key), None)
+    
+
+    def begin_batch(self) -> None:
+        self.batching = True
+
+
+    def flush(self) -> None:
+        '''Write every pending update in one transaction and end the batch.'''
+        if self.pending:
+            with self.database_manager.transaction():
+                for table_name, rows in self.pending.items():
+                    self.database_manager.update_many(table_name, 
+                                                      table_key_column(table_name), 
+                                                      list(rows.values()))
+            self.pending.clear()
+        self.batching = False
     
 
     def update(self, table_name: str, table_dictionary: BasicDict) -> None:
-        # self.database_manager...
-        ...
+        primary_key = table_key_column(table_name)
+        table_key = str(table_dictionary[primary_key])
+        if self.batching:
+            self.pending.setdefault(table_name, {}).setdefault(table_key, {}).update(table_dictionary)
+        else:
+            # Committed before the cache is touched, so a failed write leaves
+            # the cached row as the database has it.
+            with self.database_manager.transaction():
+                self.database_manager.update_table_from_dict(table_name, primary_key, table_dictionary)
+
+        cached = self.rows.get((table_name, table_key))
+        if cached is not None:
+            cached.update(table_dictionary)
     
+
     def get(self, table_name: str, table_key: str) -> dict[str, ImmutableType]:
-        raise NotImplementedError
+        key = (table_name, table_key)
+        row = self.rows.get(key)
+        if row is not None:
+            self.hits += 1
+            self.rows.move_to_end(key)
+            return dict(row)
+
+        self.misses += 1
+        found = self.database_manager.get_filtered_table(table_name, 
+                                                         {table_key_column(table_name): table_key})
+        if not found:
+            raise ValueError(f'No row in {table_name} with ID: {table_key}')
+        found[0].update(self.pending.get(table_name, {}).get(table_key, {}))
+        self.rows[key] = found[0]
+        if len(self.rows) > self.cache_size:
+            self.rows.popitem(last=False)
+            self.evictions += 1
+        return dict(found[0])
     
+
     def make_tile(self, tile_uuid: str) -> Tile:
-        ...
+        row = self.get('tiles', tile_uuid)
+        if self.database_manager.resource_storage == ResourceStorage.SPARSE:
+            # One row per resource, which the row cache has no key for.
+            resources = self.database_manager.get_resources(tile_uuid)
+        else:
+            # Only the resources the tile has, as TileView.resources reports them.
+            resources = {name: int(amount) for name, amount in self.get('resources', tile_uuid).items() 
+                         if name != 'tile_uuid' and amount}
+        return Tile(tile_uuid, int(row['x']), int(row['y']), resources)
 
     def make_city(self, city_uuid: str) -> City:
         ...
@@ -54,10 +174,18 @@ class DatabaseStrategy():
         ...
 
 
+def table_key_column(table_name: str) -> str:
+    if table_name not in TABLE_KEYS:
+        raise ValueError(f'No primary key known for table: {table_name}')
+    return TABLE_KEYS[table_name]
+
+
 class Empire:
     '''Container for player-related data.'''
 
     def __init__(self) -> None:
+        self.empire_uuid: str
+        self.is_computer: bool
         self.name: str
         self.description: str
         self.diplomatic_relations: DiplomaticRelations
@@ -82,10 +210,20 @@ class Empire:
     def turn(self):
         ...
 
+    def plan_turn(self, state: TurnState) -> list[TurnOrder]:
+        '''
+        Decide a computer empire's orders for the turn. When the game plans
+        turns (turn_workers), this is the whole of a computer empire's turn:
+        it may run in a worker process on a copy of the empire, the map in
+        the state is read-only, and the game applies the orders afterwards.
+        turn() is not called for the empire.
+        '''
+        return []
+
 
 class Game:
 
-    def __init__(self, user_uuid: str, database: DatabaseStrategy) -> None:
+    def __init__(self, user_uuid: str, database: DatabaseStrategy, turn_workers: int = 0) -> None:
         self.user_uuid: str = user_uuid
         self.database: DatabaseStrategy = database
         self.database.set_user(user_uuid)
@@ -94,13 +232,98 @@ class Game:
         self.abstractions: list[Abstraction] # = self.database.fetch_abstractions()
         self.empires: list[Empire] # = self.database.get_empires(user_uuid)
         self.visible_tiles: list[Tile] # = self.database.get_tiles(user_uuid)
+        self.map: Map # = self.database.get_map(user_uuid)
+        self.pathfinder: Pathfinder
+        self.visibility: Visibility
+        self.current_turn: int = 0
+        # With turn_workers, computer empires plan their turns in parallel
+        # (see turns.py) instead of taking them with turn(), and their merged
+        # orders are applied once the other empires have had their turns.
+        self.turn_workers: int = turn_workers
+        self.turn_planner: TurnPlanner = TurnPlanner()
+        # The turn being processed, if any; written to checkpoint_path
+        # whenever the turn pauses for the user.
+        self.checkpoint: TurnCheckpoint | None = None
+        self.checkpoint_path: str | None = None
+        # Where published events and turn reports are kept, if anywhere.
+        self.journal: EventJournal | None = None
+        self.changes: ChangeLog = ChangeLog()
+        self.snapshot_path: str | None = None
+        self.snapshot_version: int = -1
+
+
+    def close(self) -> None:
+        '''Stop the processes that plan computer turns, if any were started.'''
+        self.turn_planner.close()
+
+
+    def set_map(self, map_: Map) -> None:
+        self.map = map_
+        self.pathfinder = Pathfinder(map_)
+        self.visibility = Visibility(map_.width, map_.height)
+
+
+    def set_journal(self, journal: EventJournal) -> None:
+        '''
+        Keep events from now on in the journal, tagged with the turn under
+        way, and pick up the change sets of the turns it already holds.
+        '''
+        self.journal = journal
+        first = max(self.current_turn - self.changes.history, 0)
+        self.changes.load(TurnChanges.from_dict(e.data)
+                          for e in journal.replay(first, self.current_turn, 'turn_changes'))
+        journal.begin_turn(self.current_turn)
+
+
+    def load_map(self, snapshot_path: str) -> None:
+        '''Load the map from its snapshot file, which is written back as the map changes.'''
+        self.set_map(open_snapshot(snapshot_path))
+        self.snapshot_path = snapshot_path
+        self.snapshot_version = self.map.store.version
+        if self.journal is not None:
+            self.journal.begin_turn(self.current_turn)
+
+
+    def save_map(self) -> None:
+        '''Rewrite the map snapshot if the tiles changed since it was last written.'''
+        if self.snapshot_path is None or self.map.store.version == self.snapshot_version:
+            return
+        write_snapshot(self.map, self.snapshot_path)
+        self.snapshot_version = self.map.store.version
+
+
+    def add_sight(self, entity: Unit | City, radius: int = DEFAULT_SIGHT_RADIUS) -> None:
+        '''Let a unit or city reveal the tiles around it to its empire.'''
+        self.visibility.add_source(entity.empire_uuid, entity.instance_uuid, entity.coords, radius)
+
+
+    def grow_sight(self, city: City, radius: int) -> None:
+        self.visibility.move_source(city.instance_uuid, radius=radius)
+        self.record_city_change(city.instance_uuid)
+
+
+    def get_visibility_changes(self, empire_uuid: str) -> list[Tile]:
+        '''
+        Get the tiles that came into or went out of view for an empire since
+        the last call, so a response only has to carry those.
+        '''
+        tiles = self.map.get_tiles_at(self.visibility.drain_changes(empire_uuid))
+        return [tile for tile in tiles if tile is not None]
+
+
+    def get_unit(self, unit_uuid: str) -> Unit:
+        for empire in self.empires:
+            for unit in empire.units:
+                if unit.instance_uuid == unit_uuid:
+                    return unit
+        raise ValueError(f'No unit found with ID: {unit_uuid}')
 
 
     
 
 
 
-    def user_continue(self) : # -> dict[str, str]:
+    def user_continue(self) -> dict[str, str]:
         '''
         When the game is in the COMPUTER AWAITING USER CONTINUE phase, it 
         returns a prompt with every API call reminding the user that the end-of-turn
@@ -113,7 +336,69 @@ class Game:
                                                             (the end of turn report should
         also be saved to the database, so that we can fetch it if the user wants a reminder
         of what happened the last time the game was being played.)
+
+        Processing resumes from the turn's checkpoint, so nothing that ran
+        before the pause is run again.
+        '''
+        checkpoint = self.checkpoint
+        if self.current_phase != GamePhases.COMPUTER_AWAITING_USER_CONTINUE or checkpoint is None:
+            raise ValueError('No end-of-turn prompt is waiting for the user.')
+
+        checkpoint.prompts.pop(0)
+        if not checkpoint.prompts:
+            self.current_phase = GamePhases.COMPUTER_HAS_CONTROL
+            self.__advance()
+        if self.current_phase == GamePhases.COMPUTER_AWAITING_USER_CONTINUE:
+            self.__save_checkpoint()
+            return {'prompt': checkpoint.prompts[0]}
+        return {'report': '\n'.join(checkpoint.report)}
+
+
+    def prompt(self, message: str) -> None:
+        '''
+        Ask the user something during end-of-turn processing. The turn pauses
+        once the current empire's turn (or order) is done.
         '''
+        if self.checkpoint is None:
+            raise ValueError('Prompts can only be raised while a turn is processing.')
+        self.checkpoint.prompts.append(message)
+        self.current_phase = GamePhases.COMPUTER_AWAITING_USER_CONTINUE
+
+
+    def resume_turn(self, checkpoint_path: str) -> None:
+        '''
+        Pick up a paused turn from its checkpoint file, e.g. in a different
+        process from the one that paused it. The game must already be loaded
+        as it was at the start of the turn. Tiles changed before the pause
+        are restored, and every entity is put back where it stood (on the
+        ground or in its carrier), with units removed before the pause taken
+        off the map.
+        '''
+        checkpoint = read_checkpoint(checkpoint_path)
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint = checkpoint
+        self.current_turn = checkpoint.turn
+        if self.journal is not None:
+            self.journal.begin_turn(self.current_turn)
+        self.database.begin_batch()
+        self.database.pending = checkpoint.pending_writes
+        if checkpoint.changes:
+            self.changes.load([TurnChanges.from_dict(checkpoint.changes)])
+        self.__restore_tiles(checkpoint.tiles)
+        self.__restore_entities(checkpoint)
+        # Everything restored is already in the loaded changes; don't let
+        # the lifting and placing above count as new tile changes.
+        self.map.store.drain_changed()
+        self.current_phase = (GamePhases.COMPUTER_AWAITING_USER_CONTINUE if checkpoint.prompts 
+                              else GamePhases.COMPUTER_HAS_CONTROL)
+
+
+    def get_turn_report(self, turn: int) -> list[str]:
+        '''The end-of-turn report of an earlier turn, from the journal.'''
+        if self.journal is not None:
+            for e in self.journal.replay(turn, turn, 'turn_report'):
+                return list(e.data['report'])
+        raise ValueError(f'No report recorded for turn {turn}.')
 
 
     def user_order(self, order: UserOrder) -> Response:
@@ -123,20 +408,278 @@ class Game:
 
 
     def end_turn(self) -> None:
+        if self.checkpoint is not None:
+            raise ValueError(f'Turn {self.checkpoint.turn} has not finished processing.')
         self.current_phase = GamePhases.COMPUTER_HAS_CONTROL
+        # Every write made during the turn is held back and flushed together
+        # once the last empire has moved, so a turn reaches the database in
+        # one transaction or not at all.
+        self.database.begin_batch()
+        if self.journal is not None:
+            self.journal.begin_turn(self.current_turn)
+        self.checkpoint = TurnCheckpoint(self.current_turn)
+        self.__advance()
+        if self.current_phase == GamePhases.COMPUTER_AWAITING_USER_CONTINUE:
+            self.__save_checkpoint()
+
+
+    def plan_computer_turns(self) -> list[TurnOrder]:
+        '''
+        Let every computer empire plan its turn against the state at the end
+        of the user's turn, and merge the orders into resolution order.
+        '''
+        empires = [empire for empire in self.empires if empire.is_computer]
+        positions = {uuid: entity.coords for uuid, entity in self.map.occupancy.entities.items()}
+        state = TurnState(self.current_turn, positions, map=self.map)
+        return merge_orders(self.turn_planner.plan(empires, state, self.turn_workers))
+
+
+    def apply_order(self, order: TurnOrder) -> None:
+        try:
+            unit = self.get_unit(order.unit_uuid)
+            if unit.empire_uuid != order.empire_uuid:
+                raise ValueError(f'Unit {order.unit_uuid} does not belong to {order.empire_uuid}')
+            self.move_unit(order.unit_uuid, order.coords)
+        except ValueError as e:
+            logger.debug(f'Dropped order {order}: {e}')
+
+
+    def __advance(self) -> None:
         # the game needs to be able to pause in the calculation of the 
         # computer player moves in case it needs to receive input from
-        # the player to continue.
-        for player in self.empires:
-            player.turn()
+        # the player to continue. Each step moves the checkpoint on only
+        # once it has finished, so a pause (or a crash) never leaves a step
+        # half counted, and resuming never runs a finished step again.
+        checkpoint = self.checkpoint
+        while checkpoint is not None and checkpoint.stage != TurnStages.DONE:
+            if self.current_phase == GamePhases.COMPUTER_AWAITING_USER_CONTINUE:
+                return
+            self.__step(checkpoint)
+
+
+    def __step(self, checkpoint: TurnCheckpoint) -> None:
+        if checkpoint.stage == TurnStages.PLAN_ORDERS:
+            if self.turn_workers:
+                checkpoint.orders = self.plan_computer_turns()
+            checkpoint.stage = TurnStages.EMPIRE_TURNS
+
+        elif checkpoint.stage == TurnStages.EMPIRE_TURNS:
+            if checkpoint.empire_index < len(self.empires):
+                empire = self.empires[checkpoint.empire_index]
+                # A computer empire whose turn was planned has its orders
+                # applied in APPLY_ORDERS instead.
+                if not (self.turn_workers and empire.is_computer):
+                    empire.turn()
+                checkpoint.empire_index += 1
+            else:
+                checkpoint.stage = TurnStages.APPLY_ORDERS
+
+        elif checkpoint.stage == TurnStages.APPLY_ORDERS:
+            if checkpoint.order_index < len(checkpoint.orders):
+                self.apply_order(checkpoint.orders[checkpoint.order_index])
+                checkpoint.order_index += 1
+            else:
+                checkpoint.stage = TurnStages.COMMIT
+
+        elif checkpoint.stage == TurnStages.COMMIT:
+            self.database.flush()
+            self.save_map()
+            checkpoint.report.append(f'Turn {checkpoint.turn} complete.')
+            if self.journal is not None:
+                self.__collect_tile_changes()
+                changes = self.changes.current(checkpoint.turn).to_dict()
+                self.journal.record(events.event(self, 'turn_changes', changes))
+                self.journal.record(events.event(self, 'turn_report', {'turn': checkpoint.turn,
+                                                                       'report': checkpoint.report}))
+                self.journal.commit()
+            checkpoint.stage = TurnStages.DONE
+            self.__finish_turn()
+
+
+    def __finish_turn(self) -> None:
+        if self.checkpoint_path is not None and os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+        self.checkpoint = None
+        self.__collect_tile_changes()
+        self.current_turn += 1
+        # Events from here on belong to the user's new turn.
+        if self.journal is not None:
+            self.journal.begin_turn(self.current_turn)
+        self.changes.current(self.current_turn)
+        self.current_phase = GamePhases.USER_HAS_CONTROL
+
+
+    def __save_checkpoint(self) -> None:
+        checkpoint = self.checkpoint
+        if checkpoint is None or self.checkpoint_path is None:
+            return
+        occupancy = self.map.occupancy
+        checkpoint.positions = {uuid: entity.coords for uuid, entity in occupancy.entities.items()
+                                if occupancy.carrier_of(uuid) is None}
+        checkpoint.carriers = {uuid: carrier for uuid in occupancy.entities
+                               if (carrier := occupancy.carrier_of(uuid)) is not None}
+        checkpoint.pending_writes = self.database.pending
+        self.__collect_tile_changes()
+        changes = self.changes.current(self.current_turn)
+        checkpoint.changes = changes.to_dict()
+        # The snapshot is only rewritten at COMMIT, so tiles changed before
+        # the pause travel with the checkpoint.
+        store = self.map.store
+        checkpoint.tiles = {uuid: store.to_dict(store.rows[uuid]) for uuid in changes.tiles}
+        write_checkpoint(checkpoint, self.checkpoint_path)
+        if self.journal is not None:
+            self.journal.commit()
+
+
+    def __restore_entities(self, checkpoint: TurnCheckpoint) -> None:
+        # Put every entity where it was at the pause: lift all of them off
+        # the map first, so they can swap places if need be, then place the
+        # ones on the ground and load the rest into their carriers. Units
+        # removed before the pause stay off the map.
+        occupancy = self.map.occupancy
+        removed = [uuid for uuid, coords in checkpoint.changes.get('units', {}).items()
+                   if coords is None]
+        wanted = [*checkpoint.positions, *checkpoint.carriers]
+        entities: dict[str, Entity] = {}
+        for uuid in [*wanted, *removed]:
+            entity = occupancy.entities.get(uuid)
+            if entity is None:
+                entity = self.__find_unit(uuid)
+            if entity is None:
+                logger.debug(f'Entity {uuid} from the checkpoint is not in this game.')
+                continue
+            entities[uuid] = entity
+            if uuid in occupancy:
+                self.map.remove_entity(entity)
+
+        for uuid, coords in checkpoint.positions.items():
+            if uuid in entities:
+                entity = entities[uuid]
+                entity.x, entity.y = coords
+                self.map.place_entity(entity)
+
+        # Carriers may themselves be carried, so load whatever can be loaded
+        # until nothing more can.
+        waiting = {uuid: carrier for uuid, carrier in checkpoint.carriers.items() if uuid in entities}
+        while waiting:
+            ready = [uuid for uuid, carrier in waiting.items() if carrier in occupancy]
+            if not ready:
+                logger.debug(f'No carrier on the map for: {sorted(waiting)}')
+                break
+            for uuid in ready:
+                self.map.place_entity(entities[uuid], waiting.pop(uuid))
+
+        for uuid, entity in entities.items():
+            if uuid not in self.visibility:
+                continue
+            if uuid in occupancy:
+                self.visibility.move_source(uuid, entity.coords)
+            else:
+                self.visibility.remove_source(uuid)
+
+
+    def __restore_tiles(self, tiles: dict[str, dict[str, Any]]) -> None:
+        # Occupiers are left out: they follow the entities.
+        for uuid, fields in tiles.items():
+            tile = self.map.get_tile_from_uuid(uuid)
+            if tile is not None:
+                for name in RESTORED_TILE_FIELDS:
+                    setattr(tile, name, fields[name])
+
+
+    def __find_unit(self, unit_uuid: str) -> Unit | None:
+        try:
+            return self.get_unit(unit_uuid)
+        except ValueError:
+            return None
 
 
     def move_unit(self, unit_uuid: str, coords: tuple[int, int]) -> None:
+        unit = self.get_unit(unit_uuid)
 
-        # check whether the coords are within range
         # check whether the coords can be occupied
         # if hostile entity on coords, user must use 'attack' method
-        ...
+        destination = self.map.get_tile_from_coords(coords)
+        if destination is None:
+            raise ValueError(f'No tile found at coordinates {coords}')
+        if destination.is_occupied:
+            raise ValueError(f'Tile at {coords} is occupied; use attack instead.')
+
+        # check whether the coords are within range
+        if self.pathfinder.find_path(unit.coords, coords) is None:
+            raise ValueError(f'No route from {unit.coords} to {coords}')
+
+        self.relocate_unit(unit, coords)
+
+
+    def move_units(self, unit_uuids: list[str], coords: tuple[int, int]) -> None:
+        '''
+        Send many units toward one destination (a rally point, an enemy city).
+
+        All units share one flow field for the destination. Each unit goes as
+        far along its route as occupancy allows, so the ones behind stop where
+        the ones in front are standing.
+        '''
+        for unit_uuid in unit_uuids:
+            unit = self.get_unit(unit_uuid)
+            route = self.pathfinder.route(unit.coords, coords)
+            if route:
+                self.relocate_unit(unit, route[-1])
+
+
+    def relocate_unit(self, unit: Unit, coords: tuple[int, int]) -> None:
+        self.map.move_entity(unit, coords)
+        if unit.instance_uuid in self.visibility:
+            self.visibility.move_source(unit.instance_uuid, unit.coords)
+        self.__record_moves([unit.instance_uuid])
+
+
+    def remove_unit(self, unit: Unit) -> None:
+        '''Take a unit, and whatever it carries, off the map (e.g. when it is destroyed).'''
+        members = self.map.occupancy.group(unit.instance_uuid)
+        self.map.remove_entity(unit)
+        removed = self.changes.current(self.current_turn).units
+        for uuid in members:
+            if uuid in self.visibility:
+                self.visibility.remove_source(uuid)
+            removed[uuid] = None
+
+
+    def record_city_change(self, city_uuid: str) -> None:
+        '''Note that a city's stats changed, so clients fetch it again.'''
+        self.changes.current(self.current_turn).cities.add(city_uuid)
+
+
+    def get_changes_since(self, turn: int) -> dict[str, Any] | None:
+        '''
+        Everything that changed from the given turn until now: the tiles
+        (in full), where moved units now stand, and the cities whose stats
+        changed. The client keeps the "turn" of the answer to ask from next
+        time. None means the turn is too old, and the client needs to fetch
+        the whole game again.
+        '''
+        self.__collect_tile_changes()
+        changes = self.changes.since(turn, self.current_turn)
+        if changes is None:
+            return None
+        store = self.map.store
+        data = changes.to_dict()
+        data['tiles'] = [store.to_dict(store.rows[uuid]) for uuid in sorted(changes.tiles)]
+        return data
+
+
+    def __record_moves(self, unit_uuids: list[str]) -> None:
+        # Whatever a unit carries moves with it.
+        moved = self.changes.current(self.current_turn).units
+        for unit_uuid in unit_uuids:
+            for uuid in self.map.occupancy.group(unit_uuid):
+                moved[uuid] = self.map.occupancy.entities[uuid].coords
+
+
+    def __collect_tile_changes(self) -> None:
+        store = self.map.store
+        changed = self.changes.current(self.current_turn).tiles
+        changed.update(store.uuids[row] for row in store.drain_changed())
 
 
     def attack(self, unit_uuid: str, coords: tuple[int, int]) -> None:
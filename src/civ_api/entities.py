@@ -1,13 +1,12 @@
-from typing import Optional, Callable
+from typing import TYPE_CHECKING, Any, Optional, Callable
 
 
 
-from .bases import ProtocolCollator
-from .cartography import Tile
 from .classes import Move
 from .constants.enums import ObjectDataCategories
-from .engine import Abstraction
-from .protocols import DoesOccupyCoordinates, DoesJoinBattle
+
+if TYPE_CHECKING:
+    from .engine import Abstraction
 
 
 class Entity:
@@ -32,6 +31,8 @@ class Entity:
     - A mountain blocks all movement, but a mountain pass allows one unit at a time to occupy it.
     - Several soldiers can occupy a tank, which can then move as a single unit.
     '''
+    __slots__ = ('abstract_uuid', 'instance_uuid', 'x', 'y', 
+                 'can_be_occupied', 'is_occupied', 'callbacks')
 
     def __init__(self,
                  abstract_uuid: str,
@@ -48,7 +49,7 @@ class Entity:
         self.callbacks: dict[str, Callable[..., Any]]
 
     @property
-    def abstraction(self) -> Abstraction:
+    def abstraction(self) -> 'Abstraction':
         return self.callbacks[ObjectDataCategories.ABSTRACT](self.abstract_uuid)
 
     @property
@@ -65,6 +66,7 @@ class Entity:
 
 
 class Unit(Entity):
+    __slots__ = ('empire_uuid', 'move', 'unit_upgrades')
 
     def __init__(self, 
                  empire_uuid: str,
@@ -81,6 +83,8 @@ class Unit(Entity):
 
 
 class City(Entity):
+    __slots__ = ('empire_uuid', 'city_uuid', 'name', 'population', 'level', 
+                 'defense', 'attack', 'units', 'tiles', 'upgrades')
 
     def __init__(self, 
                  empire_uuid: str,
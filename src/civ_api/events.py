@@ -1,11 +1,33 @@
-from datetime import datetime 
-from typing import Any, Callable
+'''
+Event bus: callbacks bound to an event type are called with every event of
+that type that is published.
 
+emit and emit_many are the cheap way in: when nothing is bound to the event
+type they return before any Event is made. publish_events hands over many
+events at once, looking up each type's callbacks only once. AsyncEventBus
+queues events for dispatch on the asyncio loop instead, and makes publishers
+wait while its queue is full.
+'''
 
-__callbacks: dict[str, list[Callable[..., Any]]] = {}
+import asyncio
+import inspect
+from datetime import datetime
+from typing import Any, Callable, Iterable, Optional
+
+from loguru import logger
+
+
+# Callbacks per event type, in an insertion-ordered dict used as a set, so
+# bind and unbind are O(1) and callbacks still run in the order bound. The
+# tuples in __dispatch are what publishing iterates, rebuilt on every change
+# so a callback may bind or unbind while an event is being dispatched.
+__callbacks: dict[str, dict[Callable[..., Any], None]] = {}
+__dispatch: dict[str, tuple[Callable[..., Any], ...]] = {}
 
 
 class Event:
+    __slots__ = ('created', 'event_type', 'data', 'sender')
+
     def __init__(self):
         self.created: datetime
         self.event_type: str
@@ -15,7 +37,7 @@ class Event:
     def __repr__(self) -> str:
         elements: list[str] = [repr(self.sender), ' -> ', self.event_type, ' @ ', str(self.created)]
         return ''.join(elements)
-    
+
 
 def event(sender: object, event_type: str, data: dict[str, Any]) -> Event:
     e = Event()
@@ -27,18 +49,141 @@ def event(sender: object, event_type: str, data: dict[str, Any]) -> Event:
 
 
 def bind(event_type: str, callback: Callable[..., Any]) -> None:
-    if event_type not in __callbacks:
-        __callbacks.update({event_type: []})
-    if callback not in __callbacks[event_type]:
-        __callbacks[event_type].append(callback)
+    callbacks = __callbacks.setdefault(event_type, {})
+    if callback not in callbacks:
+        callbacks[callback] = None
+        __dispatch[event_type] = tuple(callbacks)
 
 
 def unbind(event_type: str, callback: Callable[..., Any]) -> None:
     if event_type in __callbacks:
-        __callbacks[event_type].remove(callback)
+        callbacks = __callbacks[event_type]
+        if callback not in callbacks:
+            raise ValueError(f'Callback is not bound to {event_type}.')
+        del callbacks[callback]
+        if callbacks:
+            __dispatch[event_type] = tuple(callbacks)
+        else:
+            del __callbacks[event_type]
+            del __dispatch[event_type]
+
+
+def has_subscribers(event_type: str) -> bool:
+    return event_type in __dispatch
+
+
+def callbacks_for(event_type: str) -> tuple[Callable[..., Any], ...]:
+    return __dispatch.get(event_type, ())
 
 
 def publish_event(event: Event) -> None:
-    if event.event_type in __callbacks:
-        for callback in __callbacks[event.event_type]:
-            callback(event)
+    for callback in __dispatch.get(event.event_type, ()):
+        callback(event)
+
+
+def publish_events(events: Iterable[Event]) -> None:
+    '''Publish many events in order, looking up each event type's callbacks once.'''
+    found: dict[str, tuple[Callable[..., Any], ...]] = {}
+    for e in events:
+        callbacks = found.get(e.event_type)
+        if callbacks is None:
+            callbacks = found[e.event_type] = __dispatch.get(e.event_type, ())
+        for callback in callbacks:
+            callback(e)
+
+
+def emit(sender: object, event_type: str, data: dict[str, Any]) -> None:
+    '''Make and publish an event, or do nothing if nobody is listening for it.'''
+    callbacks = __dispatch.get(event_type)
+    if callbacks is None:
+        return
+    e = event(sender, event_type, data)
+    for callback in callbacks:
+        callback(e)
+
+
+def emit_many(sender: object, event_type: str, data: Iterable[dict[str, Any]]) -> None:
+    '''
+    Publish an event of one type for each item of data, e.g. every tile a
+    unit passed through. Nothing is made if nobody is listening.
+    '''
+    callbacks = __dispatch.get(event_type)
+    if callbacks is None:
+        return
+    created = datetime.now()
+    for item in data:
+        e = Event()
+        e.sender, e.event_type, e.data, e.created = sender, event_type, item, created
+        for callback in callbacks:
+            callback(e)
+
+
+class AsyncEventBus:
+    '''
+    Dispatches events on the asyncio loop through a bounded queue.
+
+    publish waits while the queue is full, so a burst of events slows the
+    publisher down instead of piling up without limit; publish_nowait raises
+    asyncio.QueueFull instead. Worker tasks take events off the queue and
+    call the callbacks bound in this module, awaiting those that are
+    coroutine functions. A callback that raises is reported to on_error
+    (or logged) and dispatch carries on.
+    '''
+
+    def __init__(self, maxsize: int = 1024, workers: int = 1) -> None:
+        if maxsize < 1:
+            raise ValueError('The event queue must hold at least one event.')
+        self.queue: asyncio.Queue[Event] = asyncio.Queue(maxsize)
+        self.workers: int = workers
+        self.tasks: list[asyncio.Task[None]] = []
+        self.on_error: Optional[Callable[[Event, Exception], Any]] = None
+
+    async def publish(self, event: Event) -> None:
+        if has_subscribers(event.event_type):
+            await self.queue.put(event)
+
+    def publish_nowait(self, event: Event) -> None:
+        if has_subscribers(event.event_type):
+            self.queue.put_nowait(event)
+
+    async def emit(self, sender: object, event_type: str, data: dict[str, Any]) -> None:
+        if has_subscribers(event_type):
+            await self.queue.put(event(sender, event_type, data))
+
+    def start(self) -> None:
+        if not self.tasks:
+            self.tasks = [asyncio.create_task(self.__work()) for _ in range(self.workers)]
+
+    async def drain(self) -> None:
+        '''Wait until every queued event has been dispatched.'''
+        await self.queue.join()
+
+    async def stop(self) -> None:
+        '''Dispatch what is queued, then stop the workers.'''
+        await self.drain()
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    async def __work(self) -> None:
+        while True:
+            e = await self.queue.get()
+            try:
+                for callback in callbacks_for(e.event_type):
+                    await self.__call(callback, e)
+            finally:
+                self.queue.task_done()
+
+    async def __call(self, callback: Callable[..., Any], e: Event) -> None:
+        # A failing callback must not stop the worker (drain would wait
+        # forever on the events behind it) or the callbacks after it.
+        try:
+            result = callback(e)
+            if inspect.isawaitable(result):
+                await result
+        except Exception as error:
+            if self.on_error is None:
+                logger.debug(f'Callback for {e!r} failed: {error}')
+            else:
+                self.on_error(e, error)
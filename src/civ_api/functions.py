@@ -1,8 +1,12 @@
 from random import choice, randint
 from enum import StrEnum
 
+import numpy as np
+from numpy.typing import NDArray
+
 from .constants.resources import resource_minmax
-from .type_aliasing import BasicDict, ResourceRanges
+from .neighbourhood import neighbours
+from .type_aliasing import BasicDict, Coords, ResourceRanges
 
 
 class Abstraction: pass
@@ -30,19 +34,63 @@ def test_get_random_resources(resource_ranges: ResourceRanges | None = None
     return resources
 
 
+def test_get_random_resource_table(count: int,
+                                   resource_ranges: ResourceRanges | None = None,
+                                   rng: np.random.Generator | None = None
+                                   ) -> tuple[list[str], NDArray[np.int64]]:
+    '''
+    Get random assortments of the given resources for many tiles at once.
+
+    Follows the same rules as test_get_random_resources: each tile gets 1 to 4
+    distinct resources, and each amount is drawn from 1 up to either end of 
+    the resource's range. Returns the resource names and a (count x names) 
+    table of amounts, with 0 where a tile lacks the resource.
+    '''
+    if resource_ranges is None:
+        resource_ranges = resource_minmax
+    rng = rng or np.random.default_rng()
+
+    names = list(resource_ranges)
+    bounds = np.array([resource_ranges[name] for name in names], dtype=np.int64)
+
+    number_of_resources = rng.integers(1, min(4, len(names)) + 1, size=count)
+    # Rank a random key per (tile, resource) pair; the lowest ranks are picked.
+    ranks = rng.random((count, len(names))).argsort(axis=1).argsort(axis=1)
+    picked = ranks < number_of_resources[:, None]
+
+    ends = bounds[np.arange(len(names)), rng.integers(0, 2, size=(count, len(names)))]
+    amounts = rng.integers(1, ends + 1)
+    return names, np.where(picked, amounts, 0)
+
+
 def total_resources(resources: list[BasicDict]) -> dict[str, int]:
+    '''
+    Add up loose resource dictionaries, ignoring non-integer values such as
+    row keys. Tiles that are already on a Map should be totalled with
+    Map.get_total_resources, which works on the columnar store instead.
+    '''
     total: dict[str, int] = {}
+    get = total.get
     for resource in resources:
         for k, v in resource.items():
-            if not isinstance(v, int):
-                continue
-            if k not in total:
-                total.update({k: v})
-            else:
-                total.update({k: total[k] + v})
+            if isinstance(v, int):
+                total[k] = get(k, 0) + v
     return total
 
 
+def get_neighbouring_tiles(coords: Coords,
+                           width: int,
+                           height: int,
+                           radius: int = 1,
+                           ring: bool = False
+                           ) -> list[Coords]:
+    '''
+    Get the coordinates within the radius of a tile (or exactly at the radius
+    when ring is set), leaving out any that fall off the map.
+    '''
+    return [(x, y) for x, y in neighbours(coords, width, height, radius, ring).tolist()]
+
+
 def vals(enum: type[StrEnum]) -> list[str]:
     '''Syntactic shortcut to get the values of a string enum.'''
     return [e.value for e in enum]
@@ -0,0 +1,168 @@
+'''
+Append-only journal of published events, one JSON line per event.
+
+Events are buffered and written in groups: commit writes the buffer and
+syncs the file once, so a turn that emits thousands of events costs one
+fsync. The byte offset where each turn starts is kept in an index file
+beside the journal, so replaying from a turn seeks straight to it.
+'''
+
+import json
+import os
+from datetime import datetime
+from typing import IO, Iterator, Optional
+
+from . import events
+from .events import Event
+
+
+JOURNAL_BATCH_SIZE = 4096
+
+
+def sender_id(sender: object) -> Optional[str]:
+    '''What a sender is recorded as: its uuid if it has one.'''
+    for name in ('instance_uuid', 'uuid', 'user_uuid'):
+        value = getattr(sender, name, None)
+        if isinstance(value, str):
+            return value
+    return None if sender is None else repr(sender)
+
+
+class EventJournal:
+    '''
+    Records events to path, tagged with the turn they happened in.
+
+    Call begin_turn as each turn starts and commit once it is done; record
+    (or attach, to record every event of some types as it is published)
+    in between. Nothing recorded is durable until commit returns, and a
+    commit happens by itself whenever batch_size events are waiting.
+    '''
+
+    def __init__(self, path: str, batch_size: int = JOURNAL_BATCH_SIZE) -> None:
+        self.path: str = path
+        self.index_path: str = f'{path}.index'
+        self.batch_size: int = batch_size
+        self.buffer: list[str] = []
+        self.turn: int = 0
+        self.turn_offsets: dict[int, int] = {}
+        self.attached: list[str] = []
+
+        self.__file: IO[bytes] = open(path, 'ab+')
+        self.__discard_torn_tail()
+        self.__load_index()
+
+    def close(self) -> None:
+        self.commit()
+        self.detach()
+        self.__file.close()
+
+    def attach(self, *event_types: str) -> None:
+        '''Record every event of these types as it is published.'''
+        for event_type in event_types:
+            events.bind(event_type, self.record)
+            self.attached.append(event_type)
+
+    def detach(self) -> None:
+        for event_type in self.attached:
+            events.unbind(event_type, self.record)
+        self.attached = []
+
+    def begin_turn(self, turn: int) -> None:
+        '''
+        Tag the events recorded from now on with turn. Turns never go back
+        (replay relies on the file being in turn order), though the latest
+        one may be begun again, e.g. when a paused turn is resumed.
+        '''
+        latest = max(self.turn_offsets, default=turn)
+        if turn < latest:
+            raise ValueError(f'Turn {turn} is older than turn {latest}, already in the journal.')
+        self.commit()
+        self.turn = turn
+        if turn not in self.turn_offsets:
+            self.turn_offsets[turn] = self.__file.seek(0, os.SEEK_END)
+            with open(self.index_path, 'a') as index:
+                index.write(f'{turn} {self.turn_offsets[turn]}\n')
+
+    def record(self, event: Event) -> None:
+        line = json.dumps({'turn': self.turn,
+                           'type': event.event_type,
+                           'created': event.created.isoformat(),
+                           'sender': sender_id(event.sender),
+                           'data': event.data},
+                          separators=(',', ':'), default=str)
+        self.buffer.append(line)
+        if len(self.buffer) >= self.batch_size:
+            self.commit()
+
+    def commit(self) -> None:
+        '''Write every buffered event and sync the file once.'''
+        if not self.buffer:
+            return
+        self.buffer.append('')
+        self.__file.seek(0, os.SEEK_END)
+        self.__file.write('\n'.join(self.buffer).encode())
+        self.__file.flush()
+        os.fsync(self.__file.fileno())
+        self.buffer = []
+
+    def replay(self,
+               from_turn: int = 0,
+               to_turn: Optional[int] = None,
+               event_type: Optional[str] = None
+               ) -> Iterator[Event]:
+        '''
+        Yield the committed events of turns from_turn to to_turn (inclusive),
+        optionally of one type only, in the order they were recorded. The
+        sender of a replayed event is the id it was recorded with.
+        '''
+        # Each turn's events all come after its offset, so start at the
+        # earliest turn wanted or, if none was indexed, the last before it.
+        later = [offset for turn, offset in self.turn_offsets.items() if turn >= from_turn]
+        earlier = [offset for turn, offset in self.turn_offsets.items() if turn < from_turn]
+        start = min(later) if later else max(earlier, default=0)
+        with open(self.path, 'rb') as file:
+            file.seek(start)
+            for line in file:
+                record = json.loads(line)
+                if to_turn is not None and record['turn'] > to_turn:
+                    break
+                if record['turn'] < from_turn:
+                    continue
+                if event_type is not None and record['type'] != event_type:
+                    continue
+                yield self.__event(record)
+
+    @staticmethod
+    def __event(record: dict) -> Event:
+        e = events.event(record['sender'], record['type'], record['data'])
+        e.created = datetime.fromisoformat(record['created'])
+        return e
+
+    def __discard_torn_tail(self) -> None:
+        # A crash mid-commit can leave half a line at the end; it was never
+        # committed, so cut it off.
+        end = size = self.__file.seek(0, os.SEEK_END)
+        while end > 0:
+            start = max(end - 65536, 0)
+            self.__file.seek(start)
+            chunk = self.__file.read(end - start)
+            if end == size and chunk.endswith(b'\n'):
+                return
+            last = chunk.rfind(b'\n')
+            if last >= 0:
+                self.__file.truncate(start + last + 1)
+                return
+            end = start
+        self.__file.truncate(0)
+
+    def __load_index(self) -> None:
+        size = self.__file.seek(0, os.SEEK_END)
+        if not os.path.exists(self.index_path):
+            return
+        with open(self.index_path) as index:
+            for line in index:
+                turn, offset = line.split()
+                if int(offset) <= size:
+                    self.turn_offsets[int(turn)] = int(offset)
+        if self.turn_offsets:
+            self.turn = max(self.turn_offsets)
@@ -0,0 +1,78 @@
+'''
+Neighbourhood and radius queries on the square map grid.
+
+Distances are measured in moves on an eight-way grid (Chebyshev distance), so
+the radius-k disk around a tile is the (2k + 1) x (2k + 1) square centred on
+it and the radius-k ring is the border of that square.
+'''
+
+from functools import lru_cache
+
+import numpy as np
+from numpy.typing import NDArray
+
+from .type_aliasing import Coords
+
+
+@lru_cache(maxsize=None)
+def disk_offsets(radius: int) -> NDArray[np.int64]:
+    '''
+    Offsets (dx, dy) of every cell within the radius, excluding the centre.
+
+    Tables are built once per radius and returned read-only.
+    '''
+    if radius < 0:
+        raise ValueError(f'Radius must not be negative: {radius}')
+    span = np.arange(-radius, radius + 1)
+    dx, dy = np.meshgrid(span, span, indexing='ij')
+    offsets = np.stack([dx.ravel(), dy.ravel()], axis=1)
+    offsets = offsets[(offsets != 0).any(axis=1)]
+    offsets.setflags(write=False)
+    return offsets
+
+
+@lru_cache(maxsize=None)
+def ring_offsets(radius: int) -> NDArray[np.int64]:
+    '''Offsets (dx, dy) of the cells exactly the radius away from the centre.'''
+    offsets = disk_offsets(radius)
+    offsets = offsets[np.abs(offsets).max(axis=1) == radius]
+    offsets.setflags(write=False)
+    return offsets
+
+
+def offsets_for(radius: int, ring: bool = False) -> NDArray[np.int64]:
+    return ring_offsets(radius) if ring else disk_offsets(radius)
+
+
+def neighbours(coords: Coords,
+               width: int,
+               height: int,
+               radius: int = 1,
+               ring: bool = False
+               ) -> NDArray[np.int64]:
+    '''Coordinates around a single tile, clipped to the map.'''
+    cells = np.asarray(coords, dtype=np.int64) + offsets_for(radius, ring)
+    inside = ((cells[:, 0] >= 0) & (cells[:, 0] < width) &
+              (cells[:, 1] >= 0) & (cells[:, 1] < height))
+    return cells[inside]
+
+
+def batch_neighbours(coords: NDArray[np.int64] | list[Coords],
+                     width: int,
+                     height: int,
+                     radius: int = 1,
+                     ring: bool = False
+                     ) -> tuple[NDArray[np.int64], NDArray[np.bool_]]:
+    '''
+    Coordinates around many tiles at once.
+
+    Returns the candidate cells as an (N x K x 2) array, where K is the size
+    of the offset table, together with an (N x K) mask that is False for
+    cells that fall off the map. Keeping the shape fixed lets callers combine
+    the result with other per-tile arrays without a Python loop.
+    '''
+    origins = np.asarray(coords, dtype=np.int64).reshape(-1, 1, 2)
+    cells = origins + offsets_for(radius, ring)[None, :, :]
+    xs, ys = cells[..., 0], cells[..., 1]
+    inside = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+    return cells, inside
@@ -0,0 +1,170 @@
+'''Spatial index of the entities standing on each tile.'''
+
+from typing import TYPE_CHECKING, Optional
+
+import numpy as np
+from numpy.typing import NDArray
+
+from .type_aliasing import Coords
+
+if TYPE_CHECKING:
+    from .entities import Entity
+
+
+class OccupancyIndex:
+    '''
+    Keeps, for every tile, the stack of entities on it.
+
+    A tile is held by at most one entity directly (its ground occupant). Other
+    entities may sit inside an entity already on the tile, as described on
+    Entity: soldiers inside a tank, a unit in a mountain pass, a garrison in a
+    city. Each stack lists the ground occupant first and every passenger after
+    the entity carrying it; moving a carrier moves its passengers with it.
+
+    Point queries are dictionary lookups. A per-cell count grid lets
+    rectangle and radius queries skip empty cells with one array operation.
+    '''
+
+    def __init__(self, width: int, height: int) -> None:
+        self.width: int = width
+        self.height: int = height
+        self.stacks: dict[Coords, list[str]] = {}
+        self.entities: dict[str, 'Entity'] = {}
+        self.carriers: dict[str, str] = {}
+        self.passengers: dict[str, list[str]] = {}
+        self.counts: NDArray[np.int32] = np.zeros((width, height), dtype=np.int32)
+
+    def __contains__(self, uuid: object) -> bool:
+        return uuid in self.entities
+
+    def __len__(self) -> int:
+        return len(self.entities)
+
+    def at(self, coords: Coords) -> list['Entity']:
+        '''Every entity on the tile, ground occupant first.'''
+        return [self.entities[uuid] for uuid in self.stacks.get(coords, ())]
+
+    def ground_uuid(self, coords: Coords) -> Optional[str]:
+        '''The entity occupying the tile directly, if any.'''
+        stack = self.stacks.get(coords)
+        return stack[0] if stack else None
+
+    def carrier_of(self, uuid: str) -> Optional[str]:
+        return self.carriers.get(uuid)
+
+    def group(self, uuid: str) -> list[str]:
+        '''The entity followed by everything it carries, however deeply nested.'''
+        members = [uuid]
+        for passenger in self.passengers.get(uuid, ()):
+            members.extend(self.group(passenger))
+        return members
+
+    def place(self, entity: 'Entity', carrier_uuid: Optional[str] = None) -> None:
+        '''
+        Put an entity on its tile, or inside the carrier if one is given (the
+        entity then takes the carrier's coordinates).
+        '''
+        uuid = entity.instance_uuid
+        if uuid in self.entities:
+            raise ValueError(f'Entity {uuid} is already placed.')
+        if carrier_uuid is not None:
+            carrier = self.__carrier(carrier_uuid)
+            entity.x, entity.y = carrier.coords
+        coords = self.__check_cell(entity.coords, carrier_uuid)
+
+        self.entities[uuid] = entity
+        self.__attach([uuid], coords, carrier_uuid)
+
+    def move(self, uuid: str, coords: Coords, carrier_uuid: Optional[str] = None) -> None:
+        '''
+        Move an entity, and anything it carries, to new coordinates (or into
+        a carrier). Leaving a carrier is a move without one.
+        '''
+        entity = self.__entity(uuid)
+        if carrier_uuid is not None:
+            if carrier_uuid in self.group(uuid):
+                raise ValueError(f'Entity {uuid} cannot carry itself.')
+            coords = self.__carrier(carrier_uuid).coords
+        if coords != entity.coords or carrier_uuid is not None:
+            coords = self.__check_cell(coords, carrier_uuid)
+        elif self.carriers.get(uuid) is not None:
+            raise ValueError(f'Tile {coords} is already occupied.')
+
+        members = self.__detach(uuid)
+        self.__attach(members, coords, carrier_uuid)
+
+    def remove(self, uuid: str) -> list['Entity']:
+        '''Take an entity off the map, along with anything it carries.'''
+        self.__entity(uuid)
+        members = self.__detach(uuid)
+        for member in members:
+            self.carriers.pop(member, None)
+            self.passengers.pop(member, None)
+        return [self.entities.pop(member) for member in members]
+
+    def in_rect(self, x0: int, y0: int, x1: int, y1: int) -> list['Entity']:
+        '''Every entity inside the rectangle, corners included.'''
+        x0, y0 = max(x0, 0), max(y0, 0)
+        x1, y1 = min(x1, self.width - 1), min(y1, self.height - 1)
+        if x0 > x1 or y0 > y1:
+            return []
+        xs, ys = np.nonzero(self.counts[x0:x1 + 1, y0:y1 + 1])
+        found: list['Entity'] = []
+        for x, y in zip((xs + x0).tolist(), (ys + y0).tolist()):
+            found.extend(self.at((x, y)))
+        return found
+
+    def in_radius(self, coords: Coords, radius: int) -> list['Entity']:
+        '''Every entity within the radius (in moves on the eight-way grid).'''
+        x, y = coords
+        return self.in_rect(x - radius, y - radius, x + radius, y + radius)
+
+    def __entity(self, uuid: str) -> 'Entity':
+        if uuid not in self.entities:
+            raise ValueError(f'No entity placed with ID: {uuid}')
+        return self.entities[uuid]
+
+    def __carrier(self, uuid: str) -> 'Entity':
+        carrier = self.__entity(uuid)
+        if not getattr(carrier, 'can_be_occupied', False):
+            raise ValueError(f'Entity {uuid} cannot be occupied.')
+        return carrier
+
+    def __check_cell(self, coords: Coords, carrier_uuid: Optional[str]) -> Coords:
+        x, y = coords
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            raise ValueError(f'Coordinates {coords} are outside the map.')
+        if carrier_uuid is None and self.ground_uuid(coords) is not None:
+            raise ValueError(f'Tile {coords} is already occupied.')
+        return coords
+
+    def __detach(self, uuid: str) -> list[str]:
+        members = self.group(uuid)
+        coords = self.entities[uuid].coords
+        stack = self.stacks[coords]
+        leaving = set(members)
+        stack[:] = [member for member in stack if member not in leaving]
+        if not stack:
+            del self.stacks[coords]
+        self.counts[coords] -= len(members)
+
+        carrier = self.carriers.pop(uuid, None)
+        if carrier is not None:
+            self.passengers[carrier].remove(uuid)
+        return members
+
+    def __attach(self, members: list[str], coords: Coords, carrier_uuid: Optional[str]) -> None:
+        stack = self.stacks.setdefault(coords, [])
+        if carrier_uuid is None:
+            stack[0:0] = members
+        else:
+            # Passengers go straight after the last member of the carrier's group.
+            after = stack.index(self.group(carrier_uuid)[-1]) + 1
+            stack[after:after] = members
+            self.carriers[members[0]] = carrier_uuid
+            self.passengers.setdefault(carrier_uuid, []).append(members[0])
+        self.counts[coords] += len(members)
+
+        for member in members:
+            entity = self.entities[member]
+            entity.x, entity.y = coords
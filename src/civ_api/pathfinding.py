@@ -0,0 +1,220 @@
+'''Route finding over the map grid.'''
+
+from collections import OrderedDict
+from heapq import heappop, heappush
+from typing import TYPE_CHECKING, Optional
+
+import numpy as np
+from numpy.typing import NDArray
+
+from .neighbourhood import disk_offsets
+from .tile_store import EMPTY
+from .type_aliasing import Coords
+
+if TYPE_CHECKING:
+    from .cartography import Map
+
+
+STEPS: list[tuple[int, int]] = [(dx, dy) for dx, dy in disk_offsets(1).tolist()]
+INF = float('inf')
+
+
+class Pathfinder:
+    '''
+    Finds routes across a map.
+
+    Entering a tile costs its movement multiplier (at least 1). Mountains,
+    water and cells without a tile cannot be entered, and neither can tiles
+    that are occupied.
+
+    Single routes are found with A*. When many units head for the same place,
+    flow_field runs one reverse Dijkstra out from the destination and every
+    unit walks downhill on the result. Flow fields only depend on the terrain,
+    so they are cached per destination until the terrain changes; occupancy
+    moves with every unit and is checked as each unit walks its route.
+    '''
+
+    def __init__(self, map_: 'Map', cache_size: int = 32) -> None:
+        self.map: 'Map' = map_
+        self.cache_size: int = cache_size
+        self.flow_fields: OrderedDict[Coords, NDArray[np.float64]] = OrderedDict()
+        self.__costs: Optional[NDArray[np.float64]] = None
+        # The costs as a flat list (cell = x * height + y) for the search
+        # loops, with the cheapest finite cost; rebuilt with the costs.
+        self.__cost_list: Optional[list[float]] = None
+        self.__cheapest: float = INF
+        self.__terrain_version: int = -1
+
+    def __check_terrain(self) -> None:
+        version = self.map.store.terrain_version
+        if version != self.__terrain_version:
+            self.__terrain_version = version
+            self.__costs = None
+            self.__cost_list = None
+            self.flow_fields.clear()
+
+    def __rows(self) -> tuple[NDArray[np.bool_], NDArray[np.intp]]:
+        grid = self.map.grid
+        present = grid != EMPTY
+        return present, np.where(present, grid, 0)
+
+    def terrain_costs(self) -> NDArray[np.float64]:
+        '''Cost of entering each cell of the grid, or inf where it is impassable.'''
+        self.__check_terrain()
+        if self.__costs is None:
+            store = self.map.store
+            present, rows = self.__rows()
+            costs = np.maximum(store.movement_multiplier[rows], 1).astype(np.float64)
+            costs[~present | store.is_mountain[rows] | store.is_water[rows]] = np.inf
+            costs.setflags(write=False)
+            self.__costs = costs
+        return self.__costs
+
+    def __flat_costs(self) -> tuple[list[float], float]:
+        costs = self.terrain_costs()
+        if self.__cost_list is None:
+            finite = costs[np.isfinite(costs)]
+            self.__cost_list = costs.ravel().tolist()
+            self.__cheapest = float(finite.min()) if len(finite) else INF
+        return self.__cost_list, self.__cheapest
+
+    def is_occupied(self, coords: Coords) -> bool:
+        row = self.map.grid[coords]
+        return row != EMPTY and self.map.store.occupier_uuid[row] is not None
+
+    def occupied(self) -> NDArray[np.bool_]:
+        '''Mask of the cells whose tile currently has an occupier.'''
+        present, rows = self.__rows()
+        return present & np.not_equal(self.map.store.occupier_uuid[rows], None)
+
+    def find_path(self, start: Coords, goal: Coords) -> Optional[list[Coords]]:
+        '''
+        Cheapest route from start to goal, not including the start.
+
+        The goal itself may be occupied (the caller decides whether that means
+        an attack); any other occupied tile blocks the route. Returns None if
+        the goal cannot be reached.
+        '''
+        width, height = self.map.width, self.map.height
+        if not (self.map.in_bounds(start) and self.map.in_bounds(goal)):
+            return None
+
+        cost, cheapest = self.__flat_costs()
+        if cost[goal[0] * height + goal[1]] == INF:
+            return None
+        # Occupancy changes with every move, so it is looked up only for the
+        # cells the search reaches rather than masked for the whole map.
+        rows = self.map.grid.ravel()
+        occupier = self.map.store.occupier_uuid
+
+        gx, gy = goal
+        source = start[0] * height + start[1]
+        target = gx * height + gy
+        best: dict[int, float] = {source: 0.0}
+        came_from: dict[int, int] = {}
+        frontier: list[tuple[float, float, int]] = [(0.0, 0.0, source)]
+
+        while frontier:
+            _, spent, cell = heappop(frontier)
+            if cell == target:
+                return self.__unwind(came_from, source, target)
+            if spent > best[cell]:
+                continue
+            x, y = divmod(cell, height)
+            for dx, dy in STEPS:
+                nx, ny = x + dx, y + dy
+                if not (0 <= nx < width and 0 <= ny < height):
+                    continue
+                step = nx * height + ny
+                if cost[step] == INF:
+                    continue
+                if step != target and occupier[rows[step]] is not None:
+                    continue
+                total = spent + cost[step]
+                if total < best.get(step, INF):
+                    best[step] = total
+                    came_from[step] = cell
+                    estimate = max(abs(gx - nx), abs(gy - ny)) * cheapest
+                    heappush(frontier, (total + estimate, total, step))
+        return None
+
+    def __unwind(self, came_from: dict[int, int], source: int, target: int) -> list[Coords]:
+        height = self.map.height
+        path: list[Coords] = []
+        cell = target
+        while cell != source:
+            path.append(divmod(cell, height))
+            cell = came_from[cell]
+        path.reverse()
+        return path
+
+    def flow_field(self, goal: Coords) -> NDArray[np.float64]:
+        '''
+        Cost of the cheapest route from every cell to the goal (inf where the
+        goal cannot be reached), ignoring occupancy. Cached per goal.
+        '''
+        self.__check_terrain()
+        if goal in self.flow_fields:
+            self.flow_fields.move_to_end(goal)
+            return self.flow_fields[goal]
+
+        width, height = self.map.width, self.map.height
+        cost, _ = self.__flat_costs()
+        distance = [INF] * (width * height)
+
+        if self.map.in_bounds(goal) and cost[goal[0] * height + goal[1]] != INF:
+            target = goal[0] * height + goal[1]
+            distance[target] = 0.0
+            frontier: list[tuple[float, int]] = [(0.0, target)]
+            while frontier:
+                spent, cell = heappop(frontier)
+                if spent > distance[cell]:
+                    continue
+                # Stepping into this cell from a neighbour costs the cell's own cost.
+                total = spent + cost[cell]
+                x, y = divmod(cell, height)
+                for dx, dy in STEPS:
+                    nx, ny = x + dx, y + dy
+                    if not (0 <= nx < width and 0 <= ny < height):
+                        continue
+                    step = nx * height + ny
+                    if cost[step] != INF and total < distance[step]:
+                        distance[step] = total
+                        heappush(frontier, (total, step))
+
+        field = np.array(distance, dtype=np.float64).reshape(width, height)
+        field.setflags(write=False)
+        self.flow_fields[goal] = field
+        if len(self.flow_fields) > self.cache_size:
+            self.flow_fields.popitem(last=False)
+        return field
+
+    def route(self, start: Coords, goal: Coords) -> Optional[list[Coords]]:
+        '''
+        Follow the flow field for the goal from start, not including the start.
+
+        The route stops short where the next step is occupied, so a crowd of
+        units sent to one place bunches up behind the front instead of
+        failing. Returns None if the goal cannot be reached at all.
+        '''
+        field = self.flow_field(goal)
+        if not self.map.in_bounds(start) or field[start] == INF:
+            return None
+
+        costs = self.terrain_costs()
+        width, height = self.map.width, self.map.height
+        path: list[Coords] = []
+        x, y = start
+        while (x, y) != goal:
+            here = field[x, y]
+            options: list[tuple[float, int, int]] = []
+            for dx, dy in STEPS:
+                nx, ny = x + dx, y + dy
+                if 0 <= nx < width and 0 <= ny < height and field[nx, ny] < here:
+                    options.append((costs[nx, ny] + field[nx, ny], nx, ny))
+            free = [(nx, ny) for _, nx, ny in sorted(options) if not self.is_occupied((nx, ny))]
+            if not free:
+                break
+            x, y = free[0]
+            path.append((x, y))
+        return path
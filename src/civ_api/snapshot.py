@@ -0,0 +1,162 @@
+'''
+Binary snapshots of a map, opened with mmap so a game loads without
+rebuilding its tiles from SQL rows.
+
+A snapshot file is laid out as:
+
+    header      HEADER (64 bytes): magic, format version, map version,
+                width, height, tile count, the offsets below, and the
+                record size and resource count the tiles were written with
+    tiles       one TILE_RECORD per tile, in store row order
+    grid        (width x height) int32 store rows, EMPTY where there is no tile
+
+Every section is fixed-width, so opening a snapshot only validates the
+header and lays numpy views over the mapped file. The file is mapped
+copy-on-write: the game can change its tiles freely, and the changes reach
+the file when the map is written again with write_snapshot.
+'''
+
+import mmap
+import os
+
+import numpy as np
+from numpy.typing import NDArray
+
+from .cartography import Map
+from .tile_store import RESOURCE_COLUMNS, TileStore
+
+
+SNAPSHOT_MAGIC = b'CIVMAP'
+SNAPSHOT_FORMAT = 2
+UUID_LENGTH = 36
+
+HEADER = np.dtype([('magic', 'S6'),
+                   ('format', '<u2'),
+                   ('map_version', '<u8'),
+                   ('width', '<u4'),
+                   ('height', '<u4'),
+                   ('count', '<u4'),
+                   ('tiles_offset', '<u4'),
+                   ('grid_offset', '<u4'),
+                   ('record_size', '<u4'),
+                   ('resource_count', '<u2'),
+                   ('padding', 'V22')])
+
+# Numeric fields first, so they sit at fixed offsets whatever the uuid width.
+TILE_RECORD = np.dtype([('x', '<i4'),
+                        ('y', '<i4'),
+                        ('resource_multiplier', '<i2'),
+                        ('movement_multiplier', '<i2'),
+                        ('resources', '<i2', (len(RESOURCE_COLUMNS),)),
+                        ('is_mountain', '?'),
+                        ('is_water', '?'),
+                        ('uuid', f'S{UUID_LENGTH}')])
+
+
+def aligned(offset: int, alignment: int = 8) -> int:
+    return -(-offset // alignment) * alignment
+
+
+def to_records(store: TileStore) -> NDArray[np.void]:
+    '''Copy the stored tiles into an array of TILE_RECORDs.'''
+    size = store.size
+    longest = max(map(len, store.uuids), default=0)
+    if longest > UUID_LENGTH:
+        raise ValueError(f'Tile uuids of {longest} characters do not fit a snapshot '
+                         f'(at most {UUID_LENGTH}).')
+    records = np.zeros(size, dtype=TILE_RECORD)
+    records['x'] = store.x[:size]
+    records['y'] = store.y[:size]
+    records['resource_multiplier'] = store.resource_multiplier[:size]
+    records['movement_multiplier'] = store.movement_multiplier[:size]
+    records['resources'] = store.resources[:size]
+    records['is_mountain'] = store.is_mountain[:size]
+    records['is_water'] = store.is_water[:size]
+    records['uuid'] = store.uuids
+    return records
+
+
+def write_snapshot(map_: Map, path: str) -> None:
+    '''
+    Write the map to path. The file is written beside the target and then
+    renamed over it, so a reader never sees half a snapshot and a map still
+    mapped from the old file keeps working.
+    '''
+    records = to_records(map_.store)
+    grid = np.ascontiguousarray(map_.grid, dtype='<i4')
+    tiles_offset = HEADER.itemsize
+    grid_offset = aligned(tiles_offset + records.nbytes)
+
+    header = np.zeros(1, dtype=HEADER)
+    header[0] = (SNAPSHOT_MAGIC, SNAPSHOT_FORMAT, map_.store.version,
+                 map_.width, map_.height, len(records), tiles_offset, grid_offset,
+                 TILE_RECORD.itemsize, len(RESOURCE_COLUMNS), b'')
+
+    temporary = f'{path}.tmp'
+    with open(temporary, 'wb') as file:
+        file.write(header.tobytes())
+        file.write(records.tobytes())
+        file.write(bytes(grid_offset - tiles_offset - records.nbytes))
+        file.write(grid.tobytes())
+    os.replace(temporary, path)
+
+
+def read_header(buffer: mmap.mmap, path: str) -> np.void:
+    if len(buffer) < HEADER.itemsize:
+        raise ValueError(f'{path} is too short to be a map snapshot.')
+    header = np.frombuffer(buffer, dtype=HEADER, count=1)[0]
+    if header['magic'] != SNAPSHOT_MAGIC:
+        raise ValueError(f'{path} is not a map snapshot.')
+    if header['format'] != SNAPSHOT_FORMAT:
+        raise ValueError(f'{path} has snapshot format {header["format"]}, '
+                         f'expected {SNAPSHOT_FORMAT}.')
+    # The records have no per-field layout in the file, so a snapshot written
+    # with other resources (or another record layout) would be misread.
+    if header['record_size'] != TILE_RECORD.itemsize:
+        raise ValueError(f'{path} has {header["record_size"]}-byte tile records, '
+                         f'expected {TILE_RECORD.itemsize}.')
+    if header['resource_count'] != len(RESOURCE_COLUMNS):
+        raise ValueError(f'{path} has {header["resource_count"]} resources per tile, '
+                         f'expected {len(RESOURCE_COLUMNS)}.')
+
+    width, height = int(header['width']), int(header['height'])
+    end = int(header['grid_offset']) + width * height * 4
+    if len(buffer) < end:
+        raise ValueError(f'{path} is truncated ({len(buffer)} of {end} bytes).')
+    return header
+
+
+def open_snapshot(path: str, writable: bool = True) -> Map:
+    '''
+    Open a snapshot as a Map whose tiles and grid are views onto the file.
+    Unless writable, the views are read-only and any change to a tile raises.
+    '''
+    with open(path, 'rb') as file:
+        access = mmap.ACCESS_COPY if writable else mmap.ACCESS_READ
+        buffer = mmap.mmap(file.fileno(), 0, access=access)
+
+    header = read_header(buffer, path)
+    width, height = int(header['width']), int(header['height'])
+    records = np.frombuffer(buffer, dtype=TILE_RECORD, count=int(header['count']),
+                            offset=int(header['tiles_offset']))
+    grid = np.frombuffer(buffer, dtype='<i4', count=width * height,
+                         offset=int(header['grid_offset'])).reshape(width, height)
+
+    store = TileStore.from_records(records)
+    store.version = int(header['map_version'])
+    return Map(width, height, store=store, grid=grid)
+
+
+
+def frozen_copy(map_: Map) -> Map:
+    '''
+    A read-only copy of the map's tiles and grid, laid out as a snapshot
+    would be but kept in memory. Entities are not copied.
+    '''
+    records = to_records(map_.store)
+    records.setflags(write=False)
+    grid = map_.grid.copy()
+    grid.setflags(write=False)
+    store = TileStore.from_records(records)
+    store.version = map_.store.version
+    return Map(map_.width, map_.height, store=store, grid=grid)
@@ -0,0 +1,228 @@
+'''Columnar (struct-of-arrays) storage for map tiles.'''
+
+import numpy as np
+from numpy.typing import NDArray
+from typing import Any, Optional
+
+from .constants.enums import Resources
+from .functions import vals
+
+
+RESOURCE_COLUMNS: list[str] = vals(Resources)
+RESOURCE_INDEX: dict[str, int] = {r: i for i, r in enumerate(RESOURCE_COLUMNS)}
+EMPTY = -1
+
+
+class TileStore:
+    '''
+    Keeps every tile of a map as one row across a set of contiguous arrays.
+
+    Scalar tile fields get one array each, and the resources get a single
+    (rows x resources) table whose columns follow the order of the Resources
+    enum. Tile objects handed out by the map are views onto a row of the
+    store, so reading a tile never copies it and whole-map questions can be
+    answered with array operations.
+    '''
+
+    def __init__(self, capacity: int) -> None:
+        self.size: int = 0
+        self.__uuids: Optional[list[str]] = []
+        self.__rows: Optional[dict[str, int]] = {}
+        # Raw uuids of a store built from records; decoded on first use.
+        self.uuid_column: Optional[NDArray[np.bytes_]] = None
+
+        # Bumped whenever movement costs or passability change, so anything
+        # derived from the terrain (e.g. flow fields) knows to rebuild.
+        self.terrain_version: int = 0
+        # Bumped on every change to the stored tiles (not to occupiers, 
+        # which follow the entities), so snapshots know when to rewrite.
+        self.version: int = 0
+
+        capacity = max(capacity, 1)
+        # Rows changed in any way (occupier included) since drain_changed.
+        self.changed: NDArray[np.bool_] = np.zeros(capacity, dtype=np.bool_)
+        self.x: NDArray[np.int32] = np.zeros(capacity, dtype=np.int32)
+        self.y: NDArray[np.int32] = np.zeros(capacity, dtype=np.int32)
+        self.resource_multiplier: NDArray[np.int16] = np.zeros(capacity, dtype=np.int16)
+        self.movement_multiplier: NDArray[np.int16] = np.zeros(capacity, dtype=np.int16)
+        self.is_mountain: NDArray[np.bool_] = np.zeros(capacity, dtype=np.bool_)
+        self.is_water: NDArray[np.bool_] = np.zeros(capacity, dtype=np.bool_)
+        self.occupier_uuid: NDArray[np.object_] = np.full(capacity, None, dtype=object)
+        self.resources: NDArray[np.int16] = np.zeros((capacity, len(RESOURCE_COLUMNS)),
+                                                     dtype=np.int16)
+
+    @classmethod
+    def from_records(cls, records: NDArray[np.void]) -> 'TileStore':
+        '''
+        Build a store whose columns are views onto a record array with the 
+        fields of snapshot.TILE_RECORD (e.g. a memory-mapped snapshot), so 
+        nothing is copied. Occupiers are not part of the records and start 
+        empty.
+        '''
+        store = cls(0)
+        store.size = len(records)
+        store.__uuids = None
+        store.__rows = None
+        store.uuid_column = records['uuid']
+        store.x = records['x']
+        store.y = records['y']
+        store.resource_multiplier = records['resource_multiplier']
+        store.movement_multiplier = records['movement_multiplier']
+        store.is_mountain = records['is_mountain']
+        store.is_water = records['is_water']
+        store.resources = records['resources']
+        store.occupier_uuid = np.full(len(records), None, dtype=object)
+        store.changed = np.zeros(len(records), dtype=np.bool_)
+        return store
+
+    @property
+    def uuids(self) -> list[str]:
+        if self.__uuids is None:
+            column = self.uuid_column[:self.size] if self.uuid_column is not None else []
+            self.__uuids = np.char.decode(column, 'ascii').tolist()
+        return self.__uuids
+
+    @property
+    def rows(self) -> dict[str, int]:
+        if self.__rows is None:
+            self.__rows = {uuid: row for row, uuid in enumerate(self.uuids)}
+        return self.__rows
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __contains__(self, uuid: object) -> bool:
+        return uuid in self.rows
+
+    @property
+    def capacity(self) -> int:
+        return len(self.x)
+
+    @property
+    def nbytes(self) -> int:
+        '''Bytes held by the numeric columns.'''
+        return sum(a.nbytes for a in (self.x, self.y,
+                                      self.resource_multiplier,
+                                      self.movement_multiplier,
+                                      self.is_mountain,
+                                      self.is_water,
+                                      self.occupier_uuid,
+                                      self.resources))
+
+    def _grow(self) -> None:
+        capacity = max(self.capacity * 2, 1)
+        for name in ('x', 'y', 'resource_multiplier', 'movement_multiplier',
+                     'is_mountain', 'is_water', 'occupier_uuid', 'resources', 'changed'):
+            column: NDArray[Any] = getattr(self, name)
+            grown = np.zeros((capacity, *column.shape[1:]), dtype=column.dtype)
+            grown[:len(column)] = column
+            setattr(self, name, grown)
+
+    def append(self,
+               uuid: str,
+               x: int,
+               y: int,
+               resources: dict[str, int],
+               resource_multiplier: int = 2,
+               movement_multiplier: int = 2,
+               occupier_uuid: Optional[str] = None,
+               is_mountain: bool = False,
+               is_water: bool = False
+               ) -> int:
+        '''Add a tile to the store and return its row.'''
+        if uuid in self.rows:
+            raise ValueError(f'Tile {uuid} is already stored.')
+        if self.size == self.capacity:
+            self._grow()
+
+        row = self.size
+        self.x[row] = x
+        self.y[row] = y
+        self.resource_multiplier[row] = resource_multiplier
+        self.movement_multiplier[row] = movement_multiplier
+        self.occupier_uuid[row] = occupier_uuid
+        self.is_mountain[row] = is_mountain
+        self.is_water[row] = is_water
+        # A new tile is part of the map as loaded, not a change to it.
+        self.__write_resources(row, resources)
+
+        self.uuids.append(uuid)
+        self.rows[uuid] = row
+        self.size += 1
+        self.terrain_version += 1
+        return row
+
+    def touch(self, row: int, terrain: bool = False) -> None:
+        '''Note a change to a row; terrain changes also affect movement.'''
+        self.version += 1
+        self.changed[row] = True
+        if terrain:
+            self.terrain_version += 1
+
+    def set_occupier(self, row: int, occupier_uuid: Optional[str]) -> None:
+        if self.occupier_uuid[row] != occupier_uuid:
+            self.occupier_uuid[row] = occupier_uuid
+            self.changed[row] = True
+
+    def drain_changed(self) -> list[int]:
+        '''Get the rows changed since the last call, and clear them.'''
+        rows = np.flatnonzero(self.changed[:self.size]).tolist()
+        self.changed[:] = False
+        return rows
+
+    def get_resources(self, row: int) -> dict[str, int]:
+        '''Decode a row of the resource table into a dictionary of non-zero amounts.'''
+        amounts = self.resources[row]
+        return {RESOURCE_COLUMNS[i]: int(amounts[i]) for i in np.flatnonzero(amounts)}
+
+    def set_resources(self, row: int, resources: dict[str, int]) -> None:
+        self.__write_resources(row, resources)
+        self.touch(row)
+
+    def __write_resources(self, row: int, resources: dict[str, int]) -> None:
+        amounts = self.resources[row]
+        amounts[:] = 0
+        for resource, amount in resources.items():
+            try:
+                amounts[RESOURCE_INDEX[resource]] = amount
+            except KeyError:
+                raise ValueError(f'Unknown resource: {resource}')
+
+    def to_dict(self, row: int) -> dict[str, Any]:
+        '''Get the fields of a row as keyword arguments for a Tile.'''
+        return {'uuid': self.uuids[row],
+                'x': int(self.x[row]),
+                'y': int(self.y[row]),
+                'resources': self.get_resources(row),
+                'resource_multiplier': int(self.resource_multiplier[row]),
+                'movement_multiplier': int(self.movement_multiplier[row]),
+                'occupier_uuid': self.occupier_uuid[row],
+                'is_mountain': bool(self.is_mountain[row]),
+                'is_water': bool(self.is_water[row])}
+
+    def total_resources(self, groups: list[NDArray[np.int32]]) -> NDArray[np.int64]:
+        '''
+        Sum the resources of several groups of rows in one pass, applying each
+        tile's resource multiplier. 
+
+        Returns a (groups x resources) table; rows equal to EMPTY count as 
+        nothing, so unresolved coordinates can be passed straight through.
+        '''
+        totals = np.zeros((len(groups), len(RESOURCE_COLUMNS)), dtype=np.int64)
+        if not groups:
+            return totals
+
+        lengths = np.array([len(g) for g in groups], dtype=np.intp)
+        rows = np.concatenate(groups).astype(np.intp)
+        if not len(rows):
+            return totals
+
+        present = rows != EMPTY
+        rows[~present] = 0
+        weights = self.resource_multiplier[rows].astype(np.int64) * present
+        weighted = self.resources[rows] * weights[:, None]
+
+        starts = np.cumsum(lengths) - lengths
+        filled = lengths > 0
+        totals[filled] = np.add.reduceat(weighted, starts[filled], axis=0)
+        return totals
@@ -0,0 +1,209 @@
+'''
+Planning and checkpointing computer empires' turns.
+
+Each empire plans on a read-only TurnState: a read-only copy of the map (a
+snapshot file opened read-only in worker processes, a frozen copy in memory
+otherwise) and where every entity stands when the turn starts. Planning
+changes nothing; it returns TurnOrders, which the game merges and applies
+one at a time. The merge depends only on the orders themselves, so
+the outcome is the same whichever worker finishes first and however many
+workers there are.
+
+The progress of end-of-turn processing is kept in a TurnCheckpoint, which is
+written to a JSON file when the turn pauses for the user.
+'''
+
+import json
+import os
+from tempfile import TemporaryDirectory
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+from itertools import repeat
+from typing import TYPE_CHECKING, Any, NamedTuple, Optional
+
+from .cartography import Map
+from .constants.enums import TurnStages
+from .snapshot import frozen_copy, open_snapshot, write_snapshot
+from .type_aliasing import BasicDict, Coords
+
+if TYPE_CHECKING:
+    from .engine import Empire
+
+
+class TurnOrder(NamedTuple):
+    '''
+    Move a unit to coordinates. Lower priorities are applied first; when two
+    orders conflict (e.g. both target one tile), the first applied wins and
+    the other fails its checks and is dropped.
+    '''
+    empire_uuid: str
+    unit_uuid: str
+    coords: Coords
+    priority: int = 0
+
+
+class TurnState(NamedTuple):
+    '''
+    What an empire may read while planning. Worker processes get the path of
+    a snapshot written for the turn and map the file themselves; in-process
+    planning gets a frozen copy of the map. Either way the map is read-only.
+    '''
+    turn: int
+    positions: dict[str, Coords]
+    snapshot_path: Optional[str] = None
+    map: Optional[Map] = None
+
+    def get_map(self) -> Map:
+        if self.map is None:
+            if self.snapshot_path is None:
+                raise ValueError('Turn state has neither a map nor a snapshot path.')
+            return open_snapshot(self.snapshot_path, writable=False)
+        return self.map
+
+
+def plan_empire_turn(empire: 'Empire', state: TurnState) -> list[TurnOrder]:
+    return list(empire.plan_turn(state))
+
+
+class TurnPlanner:
+    '''
+    Plans every empire's turn against state.map (the game's own map, which
+    planners never see), in a pool of worker processes when there is more
+    than one worker and more than one empire. Plans come back in the order
+    of empires.
+
+    The pool is started on first use and kept for later turns, so a turn
+    does not pay for starting processes (and, where they are spawned,
+    importing the game again). Workers read a planning snapshot kept in a
+    temporary directory, rewritten only when the map has changed. It is not
+    the game's own snapshot, which is only written once the turn's database
+    writes are flushed. close shuts the pool down and removes the snapshot.
+    '''
+
+    def __init__(self) -> None:
+        self.workers: int = 0
+        self.pool: Optional[ProcessPoolExecutor] = None
+        self.directory: Optional[TemporaryDirectory[str]] = None
+        self.snapshot_key: Optional[tuple[int, int, int, int]] = None
+
+    def __enter__(self) -> 'TurnPlanner':
+        return self
+
+    def __exit__(self, *_: object) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+        if self.directory is not None:
+            self.directory.cleanup()
+            self.directory = None
+        self.snapshot_key = None
+
+    def plan(self,
+             empires: list['Empire'],
+             state: TurnState,
+             workers: int
+             ) -> list[list[TurnOrder]]:
+        if state.map is None:
+            raise ValueError('Turn state has no map to plan against.')
+        if workers > 1 and len(empires) > 1:
+            state = self.__worker_state(state)
+            return list(self.__pool(workers).map(plan_empire_turn, empires, repeat(state)))
+        state = state._replace(map=frozen_copy(state.map))
+        return [plan_empire_turn(empire, state) for empire in empires]
+
+    def __pool(self, workers: int) -> ProcessPoolExecutor:
+        if self.pool is not None and self.workers != workers:
+            self.pool.shutdown()
+            self.pool = None
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(workers)
+            self.workers = workers
+        return self.pool
+
+    def __worker_state(self, state: TurnState) -> TurnState:
+        map_ = state.map
+        if self.directory is None:
+            self.directory = TemporaryDirectory()
+        path = os.path.join(self.directory.name, 'turn.snapshot')
+        store = map_.store
+        key = (id(store), store.size, store.version, store.terrain_version)
+        if key != self.snapshot_key:
+            write_snapshot(map_, path)
+            self.snapshot_key = key
+        return state._replace(snapshot_path=path, map=None)
+
+
+def plan_turns(empires: list['Empire'],
+               state: TurnState,
+               workers: int
+               ) -> list[list[TurnOrder]]:
+    '''Plan one set of turns with a TurnPlanner of its own (see TurnPlanner).'''
+    with TurnPlanner() as planner:
+        return planner.plan(empires, state, workers)
+
+
+def merge_orders(plans: list[list[TurnOrder]]) -> list[TurnOrder]:
+    '''
+    Put the orders of every plan into one resolution order: by priority,
+    then by the empire's place in the turn order, then as the empire
+    listed them.
+    '''
+    keyed = [(order.priority, empire_index, order_index, order)
+             for empire_index, plan in enumerate(plans)
+             for order_index, order in enumerate(plan)]
+    keyed.sort(key=lambda k: k[:3])
+    return [k[3] for k in keyed]
+
+
+@dataclass
+class TurnCheckpoint:
+    '''
+    How far end-of-turn processing has got: the stage it is in, how many
+    empires have taken their turns and how many orders have been applied,
+    plus the prompts waiting for the user and the report so far.
+
+    When the turn pauses, the checkpoint also takes the writes still held
+    back in the database batch, where every entity on the ground stands,
+    which carrier holds each of the others, what has changed so far this
+    turn (as TurnChanges.to_dict) and the changed tiles in full (as
+    TileStore.to_dict), so the turn can be resumed from the file in another
+    process.
+    '''
+    turn: int
+    stage: TurnStages = TurnStages.PLAN_ORDERS
+    empire_index: int = 0
+    orders: list[TurnOrder] = field(default_factory=list)
+    order_index: int = 0
+    prompts: list[str] = field(default_factory=list)
+    report: list[str] = field(default_factory=list)
+    positions: dict[str, Coords] = field(default_factory=dict)
+    carriers: dict[str, str] = field(default_factory=dict)
+    pending_writes: dict[str, dict[str, BasicDict]] = field(default_factory=dict)
+    changes: dict[str, Any] = field(default_factory=dict)
+    tiles: dict[str, dict[str, Any]] = field(default_factory=dict)
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self))
+
+    @classmethod
+    def from_json(cls, text: str) -> 'TurnCheckpoint':
+        data = json.loads(text)
+        data['stage'] = TurnStages(data['stage'])
+        data['orders'] = [TurnOrder(e, u, (x, y), p) for e, u, (x, y), p in data['orders']]
+        data['positions'] = {uuid: (x, y) for uuid, (x, y) in data['positions'].items()}
+        return cls(**data)
+
+
+def write_checkpoint(checkpoint: TurnCheckpoint, path: str) -> None:
+    temporary = f'{path}.tmp'
+    with open(temporary, 'w') as file:
+        file.write(checkpoint.to_json())
+    os.replace(temporary, path)
+
+
+def read_checkpoint(path: str) -> TurnCheckpoint:
+    with open(path) as file:
+        return TurnCheckpoint.from_json(file.read())
@@ -0,0 +1,137 @@
+'''Fog of war: which tiles each empire has seen and can currently see.'''
+
+from typing import NamedTuple
+
+import numpy as np
+from numpy.typing import NDArray
+
+from .type_aliasing import Coords
+
+
+DEFAULT_SIGHT_RADIUS = 2
+
+
+class Sight(NamedTuple):
+    empire_uuid: str
+    coords: Coords
+    radius: int
+
+
+class Visibility:
+    '''
+    Per-empire visibility, kept up to date one sight source at a time.
+
+    Every unit or city that can see is a source with a position and a radius.
+    For each empire we count how many of its sources cover each cell; a cell
+    is visible while its count is above zero and seen once it has ever been
+    visible. Moving, adding or removing a source only touches the cells in
+    its old and new windows, and every cell whose visibility flips is marked
+    so the API can send just those tiles (see drain_changes).
+    '''
+
+    def __init__(self, width: int, height: int) -> None:
+        self.width: int = width
+        self.height: int = height
+        self.sources: dict[str, Sight] = {}
+        self.coverage: dict[str, NDArray[np.uint16]] = {}
+        self.seen: dict[str, NDArray[np.bool_]] = {}
+        self.changed: dict[str, NDArray[np.bool_]] = {}
+
+    def __contains__(self, source_uuid: object) -> bool:
+        return source_uuid in self.sources
+
+    def visible(self, empire_uuid: str) -> NDArray[np.bool_]:
+        '''Mask of the cells the empire can currently see.'''
+        self.__add_empire(empire_uuid)
+        return self.coverage[empire_uuid] > 0
+
+    def has_seen(self, empire_uuid: str) -> NDArray[np.bool_]:
+        '''Mask of the cells the empire has ever seen.'''
+        self.__add_empire(empire_uuid)
+        return self.seen[empire_uuid]
+
+    def add_source(self,
+                   empire_uuid: str,
+                   source_uuid: str,
+                   coords: Coords,
+                   radius: int = DEFAULT_SIGHT_RADIUS
+                   ) -> None:
+        if source_uuid in self.sources:
+            raise ValueError(f'Sight source {source_uuid} is already registered.')
+        sight = Sight(empire_uuid, coords, radius)
+        self.sources[source_uuid] = sight
+        self.__update(empire_uuid, [], [sight])
+
+    def move_source(self,
+                    source_uuid: str,
+                    coords: Coords | None = None,
+                    radius: int | None = None
+                    ) -> None:
+        '''Move a source and/or change how far it sees (e.g. a city growing).'''
+        old = self.__source(source_uuid)
+        new = Sight(old.empire_uuid,
+                    old.coords if coords is None else coords,
+                    old.radius if radius is None else radius)
+        if new == old:
+            return
+        self.sources[source_uuid] = new
+        self.__update(old.empire_uuid, [old], [new])
+
+    def remove_source(self, source_uuid: str) -> None:
+        old = self.__source(source_uuid)
+        del self.sources[source_uuid]
+        self.__update(old.empire_uuid, [old], [])
+
+    def drain_changes(self, empire_uuid: str) -> list[Coords]:
+        '''
+        Get the cells whose visibility changed for the empire since the last
+        call, and clear them.
+        '''
+        self.__add_empire(empire_uuid)
+        changed = self.changed[empire_uuid]
+        cells = [(x, y) for x, y in np.argwhere(changed).tolist()]
+        changed[:] = False
+        return cells
+
+    def __source(self, source_uuid: str) -> Sight:
+        if source_uuid not in self.sources:
+            raise ValueError(f'No sight source registered with ID: {source_uuid}')
+        return self.sources[source_uuid]
+
+    def __add_empire(self, empire_uuid: str) -> None:
+        if empire_uuid not in self.coverage:
+            shape = (self.width, self.height)
+            self.coverage[empire_uuid] = np.zeros(shape, dtype=np.uint16)
+            self.seen[empire_uuid] = np.zeros(shape, dtype=np.bool_)
+            self.changed[empire_uuid] = np.zeros(shape, dtype=np.bool_)
+
+    def __window(self, sight: Sight) -> tuple[int, int, int, int]:
+        x, y = sight.coords
+        r = sight.radius
+        return (max(x - r, 0), max(y - r, 0),
+                min(x + r + 1, self.width), min(y + r + 1, self.height))
+
+    def __update(self, empire_uuid: str, removed: list[Sight], added: list[Sight]) -> None:
+        self.__add_empire(empire_uuid)
+        coverage = self.coverage[empire_uuid]
+        windows = [self.__window(s) for s in removed + added]
+        windows = [w for w in windows if w[0] < w[2] and w[1] < w[3]]
+        if not windows:
+            return
+
+        # Compare before and after over the union of the windows only, so a
+        # cell in both the old and the new window is not reported as changed.
+        x0, y0 = min(w[0] for w in windows), min(w[1] for w in windows)
+        x1, y1 = max(w[2] for w in windows), max(w[3] for w in windows)
+        before = coverage[x0:x1, y0:y1] > 0
+
+        for sight in removed:
+            wx0, wy0, wx1, wy1 = self.__window(sight)
+            coverage[wx0:wx1, wy0:wy1] -= 1
+        for sight in added:
+            wx0, wy0, wx1, wy1 = self.__window(sight)
+            coverage[wx0:wx1, wy0:wy1] += 1
+
+        after = coverage[x0:x1, y0:y1] > 0
+        self.changed[empire_uuid][x0:x1, y0:y1] |= before != after
+        self.seen[empire_uuid][x0:x1, y0:y1] |= after
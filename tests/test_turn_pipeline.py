@@ -0,0 +1,269 @@
+'''
+End-of-turn processing pauses for the user and resumes from its checkpoint,
+possibly in a fresh Game, without running any stage twice.
+'''
+
+import os
+import sqlite3
+from types import SimpleNamespace
+
+import pytest
+from loguru import logger
+
+from databases.controller import DatabaseManager
+from databases.setup import setup_database
+from src.civ_api.cartography import Map
+from src.civ_api.constants.enums import GamePhases, TurnStages
+from src.civ_api.engine import DatabaseStrategy, Empire, Game
+from src.civ_api.entities import Unit
+from src.civ_api.turns import TurnOrder, read_checkpoint
+
+
+USER = 'TEST_USER'
+SIZE = 8
+
+logger.remove()
+
+
+class Log:
+    '''Everything the turn did, across every Game that worked on it.'''
+
+    def __init__(self) -> None:
+        self.plans: list[str] = []
+        self.turns: list[str] = []
+        self.orders: list[TurnOrder] = []
+        self.flushes: int = 0
+        self.written: list[str] = []
+
+
+class Player(Empire):
+    '''An empire that asks the user questions on its turn.'''
+
+    def __init__(self, game: Game, log: Log, empire_uuid: str, questions: int = 0) -> None:
+        self.game = game
+        self.log = log
+        self.empire_uuid = empire_uuid
+        self.is_computer = False
+        self.units = []
+        self.questions = questions
+
+    def turn(self) -> None:
+        self.log.turns.append(self.empire_uuid)
+        self.game.database.update('users', {'user_uuid': USER,
+                                            'current_state': f'{self.empire_uuid} moved'})
+        for i in range(self.questions):
+            self.game.prompt(f'{self.empire_uuid} asks question {i}')
+
+
+class Editor(Player):
+    '''
+    An empire that changes the map on its turn: one of its units is
+    destroyed, one boards its ship and a tile floods.
+    '''
+
+    def turn(self) -> None:
+        self.game.remove_unit(self.game.map.occupancy.entities['first-scout'])
+        self.game.map.move_entity(self.game.map.occupancy.entities['first-marine'],
+                                  (3, 5), carrier_uuid='first-ship')
+        self.game.map.get_tile_from_coords((6, 6)).is_water = True
+        super().turn()
+
+
+class Computer(Empire):
+    '''A computer empire that marches its units one tile along y.'''
+
+    def __init__(self, log: Log, empire_uuid: str, units: list[Unit]) -> None:
+        self.log = log
+        self.empire_uuid = empire_uuid
+        self.is_computer = True
+        self.units = units
+
+    def plan_turn(self, state):
+        self.log.plans.append(self.empire_uuid)
+        return [TurnOrder(self.empire_uuid, unit.instance_uuid, (x, y + 1))
+                for unit in self.units
+                for x, y in [state.positions[unit.instance_uuid]]]
+
+
+class CountingStrategy(DatabaseStrategy):
+    def __init__(self, master: object, log: Log) -> None:
+        super().__init__(master)
+        self.log = log
+
+    def flush(self) -> None:
+        self.log.flushes += 1
+        super().flush()
+
+
+class CountingGame(Game):
+    def __init__(self, *args, log: Log, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.log = log
+
+    def apply_order(self, order: TurnOrder) -> None:
+        self.log.orders.append(order)
+        super().apply_order(order)
+
+
+@pytest.fixture
+def database_path(tmp_path) -> str:
+    path = str(tmp_path / 'game.db')
+    setup_database(path)
+    with sqlite3.connect(path) as con:
+        con.execute('INSERT INTO users(user_uuid, current_state) VALUES (?, ?);',
+                    (USER, 'start'))
+    return path
+
+
+@pytest.fixture
+def checkpoint_path(tmp_path) -> str:
+    return str(tmp_path / 'turn.json')
+
+
+def new_game(database_path: str, checkpoint_path: str, log: Log) -> CountingGame:
+    '''A game as loaded at the start of turn 0, as a fresh process would load it.'''
+    database = CountingStrategy(SimpleNamespace(user_uuid=USER), log)
+    database.database_manager = DatabaseManager(database_path, USER)
+    manager = database.database_manager
+    update_many = manager.update_many
+
+    def counting_update_many(table_name, primary_key, rows):
+        log.written.append(table_name)
+        return update_many(table_name, primary_key, rows)
+
+    manager.update_many = counting_update_many
+
+    game = CountingGame(USER, database, turn_workers=1, log=log)
+    game.checkpoint_path = checkpoint_path
+    map_ = Map(SIZE, SIZE)
+    for x in range(SIZE):
+        for y in range(SIZE):
+            map_.add_tile({'uuid': f'{x}-{y}', 'x': x, 'y': y, 'resources': {}})
+    game.set_map(map_)
+
+    units = [Unit('AI', 'soldier', f'AI-unit-{i}', 2 * i, 0) for i in range(3)]
+    for unit in units:
+        map_.place_entity(unit)
+    ship = Unit('first', 'ship', 'first-ship', 3, 5)
+    ship.can_be_occupied = True
+    for unit in [Unit('first', 'soldier', 'first-scout', 1, 5),
+                 ship,
+                 Unit('first', 'soldier', 'first-marine', 5, 5)]:
+        map_.place_entity(unit)
+    game.empires = [Player(game, log, 'first'),
+                    Player(game, log, 'asker', questions=2),
+                    Computer(log, 'AI', units),
+                    Player(game, log, 'last')]
+    return game
+
+
+def stored_state(database_path: str) -> str:
+    with sqlite3.connect(database_path) as con:
+        return con.execute('SELECT current_state FROM users WHERE user_uuid = ?;',
+                           (USER,)).fetchone()[0]
+
+
+def pause_and_resume(database_path: str, 
+                     checkpoint_path: str, 
+                     log: Log, 
+                     edit: bool = False
+                     ) -> CountingGame:
+    first = new_game(database_path, checkpoint_path, log)
+    if edit:
+        first.empires[0] = Editor(first, log, 'first')
+    first.end_turn()
+    assert first.current_phase == GamePhases.COMPUTER_AWAITING_USER_CONTINUE
+    assert first.user_continue() == {'prompt': 'asker asks question 1'}
+    del first
+
+    game = new_game(database_path, checkpoint_path, log)
+    game.resume_turn(checkpoint_path)
+    return game
+
+
+def test_pause_mid_empire_turns_writes_checkpoint(database_path, checkpoint_path):
+    log = Log()
+    game = new_game(database_path, checkpoint_path, log)
+    game.end_turn()
+
+    assert game.current_phase == GamePhases.COMPUTER_AWAITING_USER_CONTINUE
+    checkpoint = read_checkpoint(checkpoint_path)
+    assert checkpoint.stage == TurnStages.EMPIRE_TURNS
+    assert checkpoint.empire_index == 2
+    assert checkpoint.prompts == ['asker asks question 0', 'asker asks question 1']
+    assert len(checkpoint.orders) == 3
+    assert checkpoint.pending_writes == {'users': {USER: {'user_uuid': USER,
+                                                          'current_state': 'asker moved'}}}
+    assert log.turns == ['first', 'asker']
+    assert log.flushes == 0
+    assert stored_state(database_path) == 'start'
+
+
+def test_resume_in_fresh_game_finishes_turn(database_path, checkpoint_path):
+    log = Log()
+    game = pause_and_resume(database_path, checkpoint_path, log)
+
+    assert game.current_phase == GamePhases.COMPUTER_AWAITING_USER_CONTINUE
+    assert game.checkpoint.empire_index == 2
+    response = game.user_continue()
+
+    assert response == {'report': 'Turn 0 complete.'}
+    assert game.current_phase == GamePhases.USER_HAS_CONTROL
+    assert game.current_turn == 1
+    assert game.checkpoint is None
+    assert not os.path.exists(checkpoint_path)
+    assert sorted(game.map.occupancy.entities[f'AI-unit-{i}'].coords for i in range(3)) == \
+        [(0, 1), (2, 1), (4, 1)]
+    with pytest.raises(ValueError):
+        game.user_continue()
+
+
+def test_no_stage_runs_twice(database_path, checkpoint_path):
+    log = Log()
+    game = pause_and_resume(database_path, checkpoint_path, log)
+    game.user_continue()
+
+    # Computer empires plan instead of taking turn(); everyone else takes
+    # exactly one turn, even though the turn ran in two games.
+    assert log.plans == ['AI']
+    assert log.turns == ['first', 'asker', 'last']
+    assert [order.unit_uuid for order in log.orders] == ['AI-unit-0', 'AI-unit-1', 'AI-unit-2']
+    assert log.flushes == 1
+
+
+def test_pending_writes_are_flushed_once(database_path, checkpoint_path):
+    log = Log()
+    game = pause_and_resume(database_path, checkpoint_path, log)
+
+    # Nothing reaches the database while the turn is paused.
+    assert log.written == []
+    assert stored_state(database_path) == 'start'
+    assert game.database.get('users', USER)['current_state'] == 'asker moved'
+
+    game.user_continue()
+
+    assert log.written == ['users']
+    assert game.database.pending == {}
+    assert stored_state(database_path) == 'last moved'
+
+
+def test_resume_keeps_changes_made_before_the_pause(database_path, checkpoint_path):
+    log = Log()
+    game = pause_and_resume(database_path, checkpoint_path, log, edit=True)
+    occupancy = game.map.occupancy
+
+    def check() -> None:
+        assert 'first-scout' not in occupancy
+        assert game.map.get_tile_from_coords((1, 5)).occupier_uuid is None
+        assert occupancy.carrier_of('first-marine') == 'first-ship'
+        assert occupancy.entities['first-marine'].coords == (3, 5)
+        assert game.map.get_tile_from_coords((5, 5)).occupier_uuid is None
+        assert game.map.get_tile_from_coords((6, 6)).is_water
+
+    check()
+    game.user_continue()
+    check()
+
+    changes = game.changes.since(0, game.current_turn)
+    assert changes.units['first-scout'] is None
+    assert {'1-5', '5-5', '6-6'} <= changes.tiles